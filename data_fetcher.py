@@ -1,25 +1,41 @@
 # data_fetcher.py
 import os
-import json
+import re
+import copy
+import orjson
 import requests
+import numpy as np
 import pandas as pd
 import logging
 import base64
 import time
-import logging
+import threading
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from binance import Client
-from ta.momentum import RSIIndicator
-from ta.trend import SMAIndicator
 from dotenv import load_dotenv
 
+from indicators import IncrementalIndicators, rsi, sma
+from rate_limiter import binance_weight
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")  # 화면 없이 이미지 버퍼로만 렌더링
+    import mplfinance as mpf
+except ImportError:  # mplfinance가 없으면 Selenium 캡처만 사용 가능
+    mpf = None
+
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import WebDriverException
+from urllib.parse import urlsplit
 
 
 load_dotenv()
@@ -31,135 +47,354 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
+OHLCV_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+# 차트 캐시 파일에 저장하는 컬럼 (OHLCV + 보조지표)
+CHART_COLUMNS = OHLCV_COLUMNS + ['RSI14', 'SMA20']
+
+# AI 전송용 컬럼별 소수점 자릿수 (거래량은 소수점 8자리까지 오므로 2자리로 줄여 토큰 절약)
+PAYLOAD_DECIMALS = {"Close": 2, "Volume": 2, "RSI14": 2, "SMA20": 2}
+
+# 뉴스 제목 키워드 매칭용 정규식 (한 번의 스캔으로 모든 키워드 검사)
+NEWS_KEYWORDS_RE = re.compile(r"\b(?:btc|eth|xrp|bitcoin|ethereum|ripple)\b", re.IGNORECASE)
+NEWS_FETCH_FACTOR = 5  # 제목 필터로 버려지는 글을 감안해 limit의 몇 배를 요청할지
+
 class DataFetcher:
     def __init__(self, 
                  binance_api_key=None, 
                  binance_api_secret=None, 
                  cryptopanic_api_key=None, 
-                 binance_testnet=False):
+                 binance_testnet=False,
+                 use_selenium_chart=False):
         # 바이낸스 API
         self.binance_api_key = binance_api_key or os.getenv("BINANCE_API_KEY")
         self.binance_api_secret = binance_api_secret or os.getenv("BINANCE_API_SECRET")
         self.binance_testnet = binance_testnet
         
-        # 바이낸스 클라이언트 초기화
-        self.client = Client(self.binance_api_key, self.binance_api_secret, testnet=self.binance_testnet)
-        if self.binance_testnet:
-            self.client.API_URL = 'https://testnet.binance.vision/api'
+        # 바이낸스 클라이언트는 처음 사용할 때 생성 (client 프로퍼티 참고)
+        self._client = None
+        self._client_lock = threading.Lock()
 
         # CryptoPanic API
         self.cryptopanic_api_key = cryptopanic_api_key or os.getenv("CRYPTOPANIC_API_KEY")
 
+        # 외부 REST 호출용 공유 세션 (keep-alive로 TCP/TLS 연결 재사용, 일시 오류 재시도)
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # 바이낸스 응답의 1분 사용 가중치를 공유 guard에 반영 (다른 API 응답에는 해당 헤더가 없어 무시됨)
+        self.session.hooks["response"].append(binance_weight.response_hook)
+
+        # 네트워크 요청용 스레드 풀 (호출마다 새로 만들지 않고 재사용)
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="data_fetcher")
+
+        # 차트 이미지: 기본은 이미 받은 캔들로 직접 렌더링, True면 Selenium으로 업비트 차트 캡처
+        self.use_selenium_chart = use_selenium_chart
+
+        # 차트 캡처용 headless Chrome (처음 캡처할 때 생성해 계속 재사용, close() 또는 with 블록 종료 시 정리)
+        self._driver = None
+        self._driver_lock = threading.Lock()
+
+        # 캔들 + 보조지표 캐시: (symbol, interval, count) -> {"df", "indicators", "fetched_at"}
+        self._chart_cache = {}
+        self._cache_lock = threading.Lock()
+        self.chart_ttl = 60  # 일봉 이외 캔들의 캐시 유지 시간(초)
+        self.indicator_warmup = 60  # 보조지표 워밍업용으로 추가 조회하는 캔들 수
+        self.cache_dir = ".cache"  # 차트 캐시 파일 저장 위치 (재시작 후 증분 조회용)
+
+        # 잔고 캐시: (조회 시각, 잔고 dict), bal_ttl 초 동안 재사용
+        self._bal_cache = None
+        self.bal_ttl = 15
+
+        # 실패한 외부 호출 기록 (negative cache): key -> 실패 시각, neg_ttl 초 동안은 다시 요청하지 않음
+        self._neg_cache = {}
+        self.neg_ttl = 300
+
+        # 공포/탐욕 지수 캐시 (ETag, Last-Modified, 마지막 값, 다음 갱신 시각)
+        # 지수는 하루 한 번 갱신되므로 파일로도 저장해 재시작 후에도 재사용
+        self.fng_cache_path = ".fng_cache.json"
+        self._fng_cache = self._load_fng_cache()
+
+    @property
+    def client(self):
+        """
+        바이낸스 클라이언트를 처음 접근할 때 생성해 반환하는 프로퍼티.
+        Client 생성 시 서버 ping이 발생하므로, 공포/탐욕 지수나 뉴스만 필요한 경우에는 만들지 않는다.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    client = Client(self.binance_api_key, self.binance_api_secret,
+                                    requests_params={"timeout": 10}, testnet=self.binance_testnet)
+                    # SDK 내부 세션도 연결 풀을 키워 keep-alive 연결을 재사용
+                    client.session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=3))
+                    client.session.headers.update({"Connection": "keep-alive"})
+                    client.session.hooks["response"].append(binance_weight.response_hook)
+                    if self.binance_testnet:
+                        client.API_URL = 'https://testnet.binance.vision/api'
+                    self._client = client
+        return self._client
+
+    def close(self):
+        """
+        스레드 풀, HTTP 세션, Chrome 드라이버를 정리하는 메서드.
+        """
+        self._executor.shutdown(wait=True)
+        self.session.close()
+        self._quit_driver()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # -------------------- 실패 캐시 -------------------- #
+    def _recently_failed(self, key):
+        """
+        key에 해당하는 외부 호출이 neg_ttl 초 이내에 실패했는지 확인하는 내부 헬퍼 메서드.
+        장애 중인 API에 매 사이클 타임아웃까지 기다리지 않도록 한다.
+        """
+        with self._cache_lock:
+            failed_at = self._neg_cache.get(key)
+        return failed_at is not None and time.monotonic() - failed_at < self.neg_ttl
+
+    def _mark_failed(self, key, failed=True):
+        """
+        외부 호출 결과를 실패 캐시에 기록(실패)하거나 제거(성공)하는 내부 헬퍼 메서드.
+        """
+        with self._cache_lock:
+            if failed:
+                self._neg_cache[key] = time.monotonic()
+            else:
+                self._neg_cache.pop(key, None)
+
     # -------------------- 바이낸스 데이터 -------------------- #
-    def fetch_binance_data(self, symbol="BTCUSDT", count_day_30=30, count_min_60=60):
+    def _fetch_klines(self, symbol, interval, limit, start_time=None):
         """
-        바이낸스에서 시세 데이터를 불러오는 메서드.
+        공개 캔들 API(/api/v3/klines)를 공유 HTTP 세션으로 직접 호출하는 내부 헬퍼 메서드.
+        서명이 필요 없는 요청이므로 바이낸스 클라이언트를 거치지 않고, 재시도/keep-alive 설정을 함께 사용한다.
+        start_time(ms)을 지정하면 그 시각에 시작하는 캔들부터 조회한다.
         """
-        def get_historical_klines(symbol, interval, lookback):
-            klines = self.client.get_historical_klines(symbol, interval, lookback)
-            df = pd.DataFrame(klines, columns=[
-                'Date', 'Open', 'High', 'Low', 'Close', 'Volume',
-                'Close_time', 'Quote_asset_volume', 'Number_of_trades',
-                'Taker_buy_base_asset_volume', 'Taker_buy_quote_asset_volume', 'Ignore'
-            ])
-            df['Date'] = pd.to_datetime(df['Date'], unit='ms')
-            df = df[['Date', 'Open', 'High', 'Low', 'Close', 'Volume']]
-            for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            return df
+        base_url = ('https://testnet.binance.vision/api' if self.binance_testnet
+                    else 'https://api.binance.com/api')
+        params = {"symbol": symbol, "interval": interval, "limit": limit}
+        if start_time is not None:
+            params["startTime"] = start_time
+        response = self.session.get(f"{base_url}/v3/klines", params=params, timeout=5)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    def _klines_to_df(self, klines):
+        """
+        바이낸스 캔들 응답을 OHLCV 데이터프레임으로 변환하는 내부 헬퍼 메서드.
+        응답의 12개 필드 중 사용하는 앞쪽 6개만, 컬럼별 변환 없이 한 번에 숫자 배열로 만든다.
+        """
+        values = np.array([kline[1:6] for kline in klines], dtype=np.float64).reshape(-1, 5)
+        df = pd.DataFrame(values, columns=OHLCV_COLUMNS[1:])
+        df.insert(0, 'Date', pd.to_datetime([kline[0] for kline in klines], unit='ms'))
+        return df
 
-        df_30 = get_historical_klines(symbol, Client.KLINE_INTERVAL_1DAY, f"{count_day_30} day ago UTC")
-        df_24h = get_historical_klines(symbol, Client.KLINE_INTERVAL_1HOUR, f"{count_min_60} hour ago UTC")
+    def _get_chart(self, symbol, interval, count):
+        """
+        보조지표가 포함된 최근 count개 캔들 데이터프레임을 캐시를 거쳐 반환하는 내부 헬퍼 메서드.
+        count + indicator_warmup개를 한 번에 조회해 지표를 계산한 뒤 뒤쪽 count개만 잘라내므로
+        반환되는 구간의 첫 행부터 RSI14/SMA20 값이 채워져 있다.
+        - 일봉: 매번 캐시의 마지막 캔들 이후만 조회해 캐시를 갱신
+        - 그 외: chart_ttl 초 동안 캐시를 그대로 사용하고, 이후 마지막 캔들 이후만 조회해 갱신
+        캐시는 cache_dir에도 저장해 재시작 후에도 이어서 사용한다.
+        캐시가 없거나 캔들 공백이 감지되면 전체 구간을 다시 조회해 재계산한다.
+        """
+        key = (symbol, interval, count)
+        with self._cache_lock:
+            entry = self._chart_cache.get(key)
+        if entry is None:
+            entry = self._load_chart_cache(key)
+
+        updated = None
+        if entry is not None:
+            if (interval != Client.KLINE_INTERVAL_1DAY
+                    and time.monotonic() - entry["fetched_at"] < self.chart_ttl):
+                return entry["df"].iloc[-count:].copy()
+            # 가중치 한도에 가까우면 기다리지 않고 캐시된 차트를 그대로 사용
+            if binance_weight.paused_for():
+                logging.warning(f"바이낸스 가중치 한도 근접, {symbol} {interval} 캐시된 차트 사용.")
+                return entry["df"].iloc[-count:].copy()
+            updated = self._update_chart(entry, symbol, interval)
+
+        if updated is not None:
+            df, indicators = updated
+        else:
+            klines = self._fetch_klines(symbol, interval, limit=count + self.indicator_warmup)
+            df = self._add_indicators(self._klines_to_df(klines))
+            # 진행 중인 마지막 캔들을 제외한 확정 캔들로 스트리밍 상태 구성
+            indicators = IncrementalIndicators.from_closes(df["Close"].iloc[:-1])
+
+        with self._cache_lock:
+            self._chart_cache[key] = {"df": df, "indicators": indicators, "fetched_at": time.monotonic()}
+        self._save_chart_cache(key, df)
+        return df.iloc[-count:].copy()
+
+    def _update_chart(self, entry, symbol, interval):
+        """
+        캐시된 마지막 캔들 시각부터의 캔들만 조회해 캐시된 차트를 갱신하는 내부 헬퍼 메서드.
+        - 마지막 캔들 시각이 같으면: 진행 중인 마지막 행만 교체
+        - 새 캔들이 생겼으면: 그 사이 캔들을 순서대로 확정하고 새 행 추가(같은 수만큼 가장 오래된 행 제거)
+        보조지표는 IncrementalIndicators로 갱신하며, 공백이 있거나 새 캔들이 너무 많으면 None을 반환한다.
+        """
+        cached = entry["df"]
+        last_ts = cached["Date"].iloc[-1]
+        limit = len(cached)
+        klines = self._fetch_klines(symbol, interval, limit=limit,
+                                    start_time=int(last_ts.value // 10**6))
+        latest = self._klines_to_df(klines)
+        # 응답 첫 캔들이 캐시의 마지막 캔들이 아니거나, 한 번에 받을 수 있는 양을 넘으면 전체 재조회
+        if latest.empty or latest["Date"].iloc[0] != last_ts or len(latest) >= limit:
+            return None
 
-        logging.info("바이낸스 데이터 수집 완료.")
-        return df_30, df_24h
+        indicators = copy.deepcopy(entry["indicators"])
+        closed_rows = []
+        for close in latest["Close"].iloc[:-1]:
+            closed_rows.append(indicators.update(close))
+        closed = latest.iloc[:-1].assign(RSI14=[r for r, _ in closed_rows],
+                                         SMA20=[m for _, m in closed_rows])
 
-    # -------------------- 보조지표 -------------------- #
-    def compute_technical_indicators(self, df_30, df_24h):
+        current = latest.iloc[[-1]]
+        rsi, sma = indicators.peek(current["Close"].iloc[0])
+        df = pd.concat([cached.iloc[:-1], closed, current.assign(RSI14=rsi, SMA20=sma)], ignore_index=True)
+        return df.iloc[-limit:].reset_index(drop=True), indicators
+
+    def _chart_cache_path(self, key):
+        """
+        차트 캐시 파일 경로를 반환하는 내부 헬퍼 메서드.
         """
-        보조지표(RSI, SMA 등)를 계산하여 데이터프레임에 추가하는 메서드.
+        symbol, interval, count = key
+        return os.path.join(self.cache_dir, f"ohlcv_{symbol}_{interval}_{count}.json")
+
+    def _load_chart_cache(self, key):
+        """
+        파일에 저장된 차트 캐시를 읽어 캐시 항목으로 복원하는 내부 헬퍼 메서드.
+        재시작 직후에도 전체 구간 대신 마지막 캔들 이후만 조회할 수 있게 한다. 없거나 읽을 수 없으면 None.
         """
+        path = self._chart_cache_path(key)
         try:
-            # RSI 추가
-            rsi_30 = RSIIndicator(close=df_30["Close"], window=14)
-            df_30["RSI14"] = rsi_30.rsi()
-
-            rsi_24h = RSIIndicator(close=df_24h["Close"], window=14)
-            df_24h["RSI14"] = rsi_24h.rsi()
-
-            # SMA 추가
-            sma_30 = SMAIndicator(close=df_30["Close"], window=20)
-            df_30["SMA20"] = sma_30.sma_indicator()
-
-            sma_24h = SMAIndicator(close=df_24h["Close"], window=20)
-            df_24h["SMA20"] = sma_24h.sma_indicator()
-
-            df_30.dropna(inplace=True)
-            df_24h.dropna(inplace=True)
-            logging.info("기술적 지표 계산 완료 및 결측치 제거됨.")
-        except KeyError as ke:
-            logging.error(f"KeyError 발생: {ke}")
-            self._set_ta_columns_none(df_30)
-            self._set_ta_columns_none(df_24h)
+            # pickle은 로드 시 임의 코드가 실행될 수 있으므로 컬럼별 JSON 배열로 저장/복원
+            with open(path, "rb") as cache_file:
+                data = orjson.loads(cache_file.read())
+            df = pd.DataFrame({col: np.array(data[col], dtype=np.float64) for col in CHART_COLUMNS[1:]})
+            df.insert(0, "Date", pd.to_datetime(data["Date"], unit="ms"))
+        except FileNotFoundError:
+            return None
         except Exception as e:
-            logging.error(f"Technical indicators computation error: {e}")
-            self._set_ta_columns_none(df_30)
-            self._set_ta_columns_none(df_24h)
-
-        # 중복 컬럼명 확인 및 처리
-        df_30 = self._make_unique_columns(df_30)
-        df_24h = self._make_unique_columns(df_24h)
-        self._verify_unique_columns(df_30, "df_30")
-        self._verify_unique_columns(df_24h, "df_24h")
-
-        return df_30, df_24h
+            logging.warning(f"차트 캐시 파일을 읽지 못했습니다: {path} ({e})")
+            return None
+        indicators = IncrementalIndicators.from_closes(df["Close"].iloc[:-1])
+        return {"df": df, "indicators": indicators, "fetched_at": float("-inf")}
 
-    def _set_ta_columns_none(self, df):
+    def _save_chart_cache(self, key, df):
         """
-        보조지표 컬럼을 None으로 설정하는 내부 헬퍼 메서드.
+        차트 캐시를 파일로 저장하는 내부 헬퍼 메서드.
         """
-        ta_columns = [col for col in df.columns 
-                      if col not in ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']]
-        df[ta_columns] = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            data = {col: df[col].to_numpy(dtype=np.float64) for col in CHART_COLUMNS[1:]}
+            data["Date"] = df["Date"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+            with open(self._chart_cache_path(key), "wb") as cache_file:
+                cache_file.write(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY))
+        except OSError as e:
+            logging.warning(f"차트 캐시 파일 저장 실패: {e}")
 
-    def _make_unique_columns(self, df):
+    # -------------------- 보조지표 -------------------- #
+    def _add_indicators(self, df):
         """
-        데이터프레임의 컬럼명을 고유하게 만드는 내부 헬퍼 메서드.
+        데이터프레임 하나에 RSI14, SMA20 컬럼을 추가하는 내부 헬퍼 메서드.
+        종가는 한 번만 연속 배열로 변환해 두 지표가 같은 버퍼를 사용한다.
         """
-        cols = pd.Series(df.columns)
-        for dup in cols[cols.duplicated()].unique():
-            cols[cols[cols == dup].index.tolist()] = [
-                dup + '_' + str(i) if i != 0 else dup for i in range(sum(cols == dup))
-            ]
-        df.columns = cols
+        close = df["Close"].to_numpy(dtype="float64")
+        df["RSI14"] = rsi(close, 14)
+        df["SMA20"] = sma(close, 20)
         return df
 
-    def _verify_unique_columns(self, df, name):
+    # -------------------- 공포/탐욕 지수 -------------------- #
+    def _load_fng_cache(self):
+        """
+        파일에 저장된 공포/탐욕 지수 캐시를 읽어오는 내부 헬퍼 메서드. 없거나 읽을 수 없으면 빈 캐시를 반환한다.
+        """
+        cache = {"etag": None, "last_modified": None, "value": None, "expires_at": 0}
+        try:
+            with open(self.fng_cache_path, "rb") as cache_file:
+                cache.update(orjson.loads(cache_file.read()))
+        except FileNotFoundError:
+            pass
+        except (OSError, orjson.JSONDecodeError) as e:
+            logging.warning(f"공포/탐욕 지수 캐시 파일을 읽지 못했습니다: {e}")
+        return cache
+
+    def _save_fng_cache(self):
         """
-        데이터프레임의 모든 컬럼명이 고유한지 확인하는 내부 헬퍼 메서드.
+        공포/탐욕 지수 캐시를 파일로 저장하는 내부 헬퍼 메서드.
         """
-        duplicates = df.columns[df.columns.duplicated()].tolist()
-        if duplicates:
-            raise ValueError(f"{name} has duplicate columns: {duplicates}")
+        try:
+            with open(self.fng_cache_path, "wb") as cache_file:
+                cache_file.write(orjson.dumps(self._fng_cache))
+        except OSError as e:
+            logging.warning(f"공포/탐욕 지수 캐시 파일 저장 실패: {e}")
 
-    # -------------------- 공포/탐욕 지수 -------------------- #
     def fetch_fear_greed_index(self):
         """
         공포/탐욕 지수를 가져오는 메서드.
+        API가 알려주는 다음 갱신 시각(time_until_update)까지는 요청 없이 캐시된 값을 반환하고,
+        이후에는 직전 응답의 ETag/Last-Modified로 조건부 요청을 보내 304이면 캐시된 값을 그대로 반환한다.
+        요청이 실패하면 마지막으로 받은 값을 대신 반환한다.
         """
+        if self._fng_cache["value"] is not None and time.time() < self._fng_cache["expires_at"]:
+            logging.info("공포/탐욕 지수 갱신 전, 캐시 사용.")
+            return dict(self._fng_cache["value"])
+
+        if self._recently_failed("fng"):
+            logging.info("공포/탐욕 지수 API 최근 실패, 요청 생략.")
+            return dict(self._fng_cache["value"] or {"value": None, "classification": None})
+
         url = "https://api.alternative.me/fng/?limit=1"
+        headers = {}
+        if self._fng_cache["etag"]:
+            headers["If-None-Match"] = self._fng_cache["etag"]
+        if self._fng_cache["last_modified"]:
+            headers["If-Modified-Since"] = self._fng_cache["last_modified"]
+
         try:
-            response = requests.get(url, timeout=5)
-            fng_data = response.json()
+            response = self.session.get(url, headers=headers, timeout=5)
+            if response.status_code == 304 and self._fng_cache["value"] is not None:
+                logging.info("공포/탐욕 지수 변경 없음 (304), 캐시 사용.")
+                return dict(self._fng_cache["value"])
+
+            fng_data = orjson.loads(response.content)
+            time_until_update = 0
             if "data" in fng_data and len(fng_data["data"]) > 0:
                 fng_value = fng_data["data"][0].get("value", None)
                 fng_classification = fng_data["data"][0].get("value_classification", None)
+                time_until_update = int(fng_data["data"][0].get("time_until_update") or 0)
             else:
                 fng_value = None
                 fng_classification = None
+
+            self._fng_cache = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "value": {"value": fng_value, "classification": fng_classification},
+                "expires_at": time.time() + time_until_update
+            }
+            self._save_fng_cache()
+            self._mark_failed("fng", False)
             logging.info("공포/탐욕 지수 수집 완료.")
         except Exception as e:
             logging.error(f"Fear & Greed Index API 요청 중 오류 발생: {e}")
+            self._mark_failed("fng")
+            if self._fng_cache["value"] is not None:
+                logging.info("마지막으로 받은 공포/탐욕 지수를 대신 사용.")
+                return dict(self._fng_cache["value"])
             fng_value = None
             fng_classification = None
 
@@ -172,9 +407,24 @@ class DataFetcher:
     def fetch_balances(self):
         """
         바이낸스에서 잔고를 조회하는 메서드.
+        직전 조회 후 bal_ttl 초 이내라면 캐시된 잔고를 반환한다.
         """
+        with self._cache_lock:
+            cached = self._bal_cache
+        if cached is not None and time.monotonic() - cached[0] < self.bal_ttl:
+            return dict(cached[1])
+
+        if self._recently_failed("balances"):
+            logging.info("잔고 조회 최근 실패, 요청 생략.")
+            return {}
+
+        if binance_weight.paused_for():
+            logging.warning("바이낸스 가중치 한도 근접, 잔고 조회 생략.")
+            return dict(cached[1]) if cached is not None else {}
+
         try:
-            account_info = self.client.get_account()
+            # 잔고가 0인 자산은 서버에서 제외 (응답 크기 축소)
+            account_info = self.client.get_account(omitZeroBalances="true")
             balances = {}
             for balance in account_info['balances']:
                 asset = balance['asset']
@@ -183,10 +433,14 @@ class DataFetcher:
                 total = free + locked
                 if total > 0:
                     balances[asset] = total
+            with self._cache_lock:
+                self._bal_cache = (time.monotonic(), balances)
+            self._mark_failed("balances", False)
             logging.info("잔고 조회 완료.")
-            return balances
+            return dict(balances)
         except Exception as e:
             logging.error(f"잔고 조회 중 오류 발생: {e}")
+            self._mark_failed("balances")
             return {}
 
     # -------------------- CryptoPanic 뉴스 -------------------- #
@@ -194,42 +448,153 @@ class DataFetcher:
         """
         CryptoPanic API를 사용하여 BTC, ETH, XRP에 관련된 최신 뉴스 헤드라인을 가져오는 메서드.
         """
+        if self._recently_failed("news"):
+            logging.info("CryptoPanic API 최근 실패, 요청 생략.")
+            return []
+
         base_url = "https://cryptopanic.com/api/v1/posts/"
+        # 종목 필터링은 서버(currencies)에서 처리.
+        # 아래에서 제목 기준으로 한 번 더 거르므로, limit개가 남도록 넉넉히(NEWS_FETCH_FACTOR배) 받아 온다
         params = {
             "auth_token": self.cryptopanic_api_key,
             "filter": "news",
             "regions": "en",
-            "limit": 50
+            "currencies": "BTC,ETH,XRP",
+            "public": "true",
+            "limit": limit * NEWS_FETCH_FACTOR
         }
         try:
-            response = requests.get(base_url, params=params, timeout=5)
+            response = self.session.get(base_url, params=params, timeout=5)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
+            # 서버 필터는 태그 기준이므로, 제목에 종목이 언급된 뉴스만 limit개까지 선택
             news_list = []
-            keywords = ["btc", "eth", "xrp"]
             for post in data.get("results", []):
-                title = post.get("title", "").lower()
-                if any(keyword in title for keyword in keywords):
+                title = post.get("title", "")
+                if NEWS_KEYWORDS_RE.search(title):
                     news_list.append({
-                        "title": post.get("title", ""),
+                        "title": title,
                         "pub_at": post.get("published_at", "")
                     })
                     if len(news_list) >= limit:
                         break
+            self._mark_failed("news", False)
             logging.info("CryptoPanic 뉴스 수집 완료.")
             return news_list
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             logging.error(f"CryptoPanic API 요청 중 오류 발생: {e}")
+            self._mark_failed("news")
             return []
 
     # -------------------- 스크린샷 캡처 -------------------- #
-    def capture_chart_image(self, url, save_path="Captured_image/full_screenshot.png"):
-        folder_path = os.path.dirname(save_path)
-        if folder_path and not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-            logging.info(f"폴더 생성 완료: {folder_path}")
+    def capture_chart_image(self, url, save_path=None, quality=80):
+        """
+        차트 페이지의 스크린샷을 찍어 data URL(base64) 문자열로 반환하는 메서드.
+        스크린샷은 파일을 거치지 않고 메모리에서 바로 인코딩한다.
+        save_path를 지정하면 인코딩한 이미지를 파일로도 저장한다.
+        """
+        with self._driver_lock:
+            try:
+                driver = self._get_driver()
+            except Exception as e:
+                logging.error(f"WebDriver 초기화 중 오류 발생: {e}")
+                return None
+
+            try:
+                # 재사용 중인 브라우저에 남은 차트 설정(localStorage)을 지워 매번 기본 레이아웃에서 시작
+                origin = "{0.scheme}://{0.netloc}".format(urlsplit(url))
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin",
+                                       {"origin": origin, "storageTypes": "local_storage"})
+                driver.get(url)
+
+                # 차트 캔버스가 그려질 때까지 대기
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "#fullChartiq canvas"))
+                )
+
+                # 1) "시간 메뉴" 클릭 (필요하다면 여전히 활용)
+                # menu_button = WebDriverWait(driver, 10).until(
+                #     EC.element_to_be_clickable(
+                #         (By.XPATH, '//*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[1]/span/cq-clickable')
+                #     )
+                # )
+                # menu_button.click()
+
+                # 2) "지표" 메뉴 클릭 (XPath: //*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/span)
+                try:
+                    indicator_menu = WebDriverWait(driver, 10).until(
+                        EC.element_to_be_clickable((By.XPATH, '//*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/span'))
+                    )
+                    indicator_menu.click()
+                    logging.info("지표 메뉴 클릭 완료.")
+                except Exception as e:
+                    logging.warning(f"지표 메뉴 버튼을 찾지 못했습니다: {e}")
+
+                # 3) "볼린저 밴드" 옵션 클릭 (XPath: //*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/cq-menu-dropdown/cq-scroll/cq-studies/cq-studies-content/cq-item[15])
+                #    드롭다운이 표시될 때까지는 element_to_be_clickable 대기로 처리
+                dropdown_xpath = '//*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/cq-menu-dropdown'
+                try:
+                    bollinger_option = WebDriverWait(driver, 10).until(
+                        EC.element_to_be_clickable((By.XPATH, dropdown_xpath + '/cq-scroll/cq-studies/cq-studies-content/cq-item[15]'))
+                    )
+                    bollinger_option.click()
+                    logging.info('"볼린저 밴드" 옵션 클릭 완료.')
+                    # 지표가 반영되어 드롭다운이 닫힐 때까지 최대 3초 대기
+                    WebDriverWait(driver, 3).until(
+                        EC.invisibility_of_element_located((By.XPATH, dropdown_xpath))
+                    )
+                except Exception as e:
+                    logging.warning(f'"볼린저 밴드" 옵션 처리 중 문제 발생: {e}')
+
+                # 4) 스크린샷 찍기: CDP Page.captureScreenshot으로 합성된 화면을 한 번에 PNG로 받음
+                screenshot = driver.execute_cdp_cmd("Page.captureScreenshot",
+                                                    {"format": "png", "fromSurface": True})
+                png_bytes = base64.b64decode(screenshot["data"])
+                logging.info("스크린샷 캡처 완료.")
+
+            except Exception as e:
+                logging.error(f"스크린샷 캡처 중 오류 발생: {e}")
+                return None
+
+        return self._encode_screenshot(png_bytes, save_path, quality)
+
+    def render_chart_locally(self, df, save_path=None, quality=80):
+        """
+        이미 조회한 캔들 데이터로 캔들+거래량 차트를 직접 그려 data URL(base64) 문자열로 반환하는 메서드.
+        브라우저를 띄우지 않으므로 Selenium 캡처보다 훨씬 빠르고 메모리도 적게 쓴다.
+        """
+        if mpf is None:
+            logging.error("mplfinance가 설치되어 있지 않아 차트를 렌더링할 수 없습니다.")
+            return None
+
+        try:
+            buffer = BytesIO()
+            mpf.plot(df.set_index("Date"), type="candle", volume=True, style="charles",
+                     savefig=dict(fname=buffer, format="png", dpi=100))
+            logging.info("차트 렌더링 완료.")
+        except Exception as e:
+            logging.error(f"차트 렌더링 중 오류 발생: {e}")
+            return None
+
+        return self._encode_screenshot(buffer.getvalue(), save_path, quality)
+
+    def _get_driver(self):
+        """
+        재사용할 headless Chrome 드라이버를 반환하는 내부 헬퍼 메서드.
+        드라이버가 없거나 응답하지 않으면 새로 생성한다. (_driver_lock 안에서 호출)
+        """
+        if self._driver is not None:
+            try:
+                self._driver.current_url
+                return self._driver
+            except WebDriverException:
+                logging.warning("WebDriver가 응답하지 않아 다시 생성합니다.")
+                self._quit_driver()
 
         chrome_options = Options()
+        # driver.get이 load 이벤트(이미지/폰트 등)까지 기다리지 않고 DOMContentLoaded에서 반환하도록 설정.
+        # 차트가 실제로 그려졌는지는 캔버스 요소를 WebDriverWait로 확인한다.
+        chrome_options.page_load_strategy = "eager"
         chrome_options.add_argument("--headless")
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--no-sandbox")
@@ -242,113 +607,113 @@ class DataFetcher:
         chrome_options.add_argument("--disable-extensions")
         chrome_options.add_argument("--disable-infobars")
 
-        try:
-            driver = webdriver.Chrome(options=chrome_options)
-        except Exception as e:
-            logging.error(f"WebDriver 초기화 중 오류 발생: {e}")
-            return None
+        self._driver = webdriver.Chrome(options=chrome_options)
+        logging.info("WebDriver 생성 완료.")
+        return self._driver
 
-        try:
-            driver.get(url)
-            time.sleep(5)  # 페이지 로딩 대기
-
-            # 1) "시간 메뉴" 클릭 (필요하다면 여전히 활용)
-            # menu_button = WebDriverWait(driver, 10).until(
-            #     EC.element_to_be_clickable(
-            #         (By.XPATH, '//*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[1]/span/cq-clickable')
-            #     )
-            # )
-            # menu_button.click()
-            # time.sleep(2)
-
-            # 2) "지표" 메뉴 클릭 (XPath: //*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/span)
-            try:
-                indicator_menu = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/span'))
-                )
-                indicator_menu.click()
-                logging.info("지표 메뉴 클릭 완료.")
-                time.sleep(2)  # 드롭다운 표시 대기
-            except Exception as e:
-                logging.warning(f"지표 메뉴 버튼을 찾지 못했습니다: {e}")
-
-            # 3) "볼린저 밴드" 옵션 클릭 (XPath: //*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/cq-menu-dropdown/cq-scroll/cq-studies/cq-studies-content/cq-item[15])
+    def _quit_driver(self):
+        """
+        재사용 중인 Chrome 드라이버를 종료하는 내부 헬퍼 메서드.
+        """
+        driver, self._driver = self._driver, None
+        if driver is not None:
             try:
-                bollinger_option = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="fullChartiq"]/div/div/div[1]/div/div/cq-menu[3]/cq-menu-dropdown/cq-scroll/cq-studies/cq-studies-content/cq-item[15]'))
-                )
-                bollinger_option.click()
-                logging.info('"볼린저 밴드" 옵션 클릭 완료.')
-                time.sleep(3)  # 지표가 반영될 때까지 대기
+                driver.quit()
             except Exception as e:
-                logging.warning(f'"볼린저 밴드" 옵션을 찾지 못했습니다: {e}')
-
-            # 4) 스크린샷 찍기
-            driver.save_screenshot(save_path)
-            logging.info(f"스크린샷 저장 완료: {save_path}")
-            return save_path
+                logging.warning(f"WebDriver 종료 중 오류 발생: {e}")
 
+    def _encode_screenshot(self, png_bytes, save_path=None, quality=80, max_width=1024):
+        """
+        스크린샷 PNG 바이트를 손실 WebP로 다시 압축해 data URL(base64) 문자열로 변환하는 내부 헬퍼 메서드.
+        1920x1080 차트 기준 PNG(수백 KB) 대비 수십 KB 수준으로 줄어 Vision API 전송량이 크게 감소한다.
+        Vision API는 이미지를 512px 타일 단위로 처리하므로, max_width보다 넓으면 비율을 유지해 줄인다.
+        """
+        try:
+            image = Image.open(BytesIO(png_bytes)).convert("RGB")
+            if image.width > max_width:
+                image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, "WEBP", quality=quality, method=6)
+            image_bytes, mime_type = buffer.getvalue(), "image/webp"
+
+            if save_path:
+                folder_path = os.path.dirname(save_path)
+                if folder_path:
+                    os.makedirs(folder_path, exist_ok=True)
+                with open(save_path, "wb") as image_file:
+                    image_file.write(image_bytes)
+                logging.info(f"스크린샷 저장 완료: {save_path}")
+
+            encoded_string = base64.b64encode(image_bytes).decode('utf-8')
+            logging.info(f"이미지 인코딩 완료: {mime_type}, {len(image_bytes)} bytes")
+            return f"data:{mime_type};base64,{encoded_string}"
         except Exception as e:
-            logging.error(f"스크린샷 캡처 중 오류 발생: {e}")
+            logging.error(f"이미지 인코딩 중 오류 발생: {e}")
             return None
 
-        finally:
-            driver.quit()
-
-
-
     # -------------------- 데이터 검증 -------------------- #
     def validate_data(self, df, name):
         """
         데이터프레임의 무결성을 검증하는 메서드.
+        결측치는 컬럼별 hasnans로 검사해, 문제가 있는 첫 컬럼에서 바로 중단한다.
         """
         if df.empty:
             raise ValueError(f"{name} 데이터프레임이 비어 있습니다.")
-        if df.isnull().values.any():
-            raise ValueError(f"{name} 데이터프레임에 결측치가 존재합니다.")
-
-    # -------------------- 이미지 인코딩 -------------------- #
-    def encode_image_to_base64(self, image_path):
-        """
-        이미지 파일을 Base64 문자열로 인코딩하는 메서드.
-        """
-        try:
-            with open(image_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            logging.info(f"이미지 인코딩 완료: {image_path}")
-            return encoded_string
-        except Exception as e:
-            logging.error(f"이미지 인코딩 중 오류 발생: {e}")
-            return None
+        for col in df.columns:
+            if df[col].hasnans:
+                raise ValueError(f"{name} 데이터프레임의 {col} 컬럼에 결측치가 존재합니다.")
 
     # -------------------- AI 데이터 준비 -------------------- #
-    def prepare_data_for_ai(self, df_30, df_24h, fear_greed, balances, crypto_news, chart_image_path=None):
+    def prepare_data_for_ai(self, df_30, df_24h, fear_greed, balances, crypto_news, chart_image=None):
         """
         AI에게 넘길 데이터를 구성하는 메서드.
+        차트 데이터는 데이터프레임 그대로 담고, 직렬화는 preprocess_data_for_api에서 필요한 행만 수행한다.
         """
         self.validate_data(df_30, "df_30")
         self.validate_data(df_24h, "df_24h")
 
-        day_30_records = df_30.to_dict(orient='records')
-        hour_24_records = df_24h.to_dict(orient='records')
-
         data_for_ai = {
             "balance": balances,
             "chart_data": {
-                "day_30": day_30_records,
-                "hour_24": hour_24_records
+                "day_30": df_30,
+                "hour_24": df_24h
             },
             "fear_greed": fear_greed,
             "crypto_news": crypto_news
         }
 
-        if chart_image_path:
-            encoded_image = self.encode_image_to_base64(chart_image_path)
-            if encoded_image:
-                data_for_ai["chart_image"] = encoded_image
+        if chart_image:
+            data_for_ai["chart_image"] = chart_image
 
         return data_for_ai
 
+    def _to_columns(self, df):
+        """
+        데이터프레임을 컬럼별 리스트(dict of lists)로 변환하는 내부 헬퍼 메서드.
+        Date 컬럼은 epoch 초(int)로 변환한다.
+        """
+        columns = {"Date": df["Date"].astype("datetime64[s]").astype("int64").tolist()}
+        for col in df.columns:
+            if col != "Date":
+                columns[col] = df[col].tolist()
+        return columns
+
+    def _summarize(self, df):
+        """
+        전체 구간의 요약 통계(평균/표준편차/고가/저가/추세 기울기)를 계산하는 내부 헬퍼 메서드.
+        최근 몇 개 캔들만 보내는 대신 전체 흐름은 이 요약으로 전달한다.
+        """
+        close = df["Close"].to_numpy()
+        # 캔들 하나당 종가 변화량 (1차 회귀 기울기)
+        slope = np.polyfit(np.arange(close.size), close, 1)[0] if close.size > 1 else 0.0
+        return {
+            "mean": round(float(close.mean()), 2),
+            "std": round(float(close.std(ddof=1)), 2) if close.size > 1 else 0.0,
+            "high": round(float(df["High"].max()), 2),
+            "low": round(float(df["Low"].min()), 2),
+            "slope": round(float(slope), 4)
+        }
+
     def preprocess_data_for_api(self, data_for_ai, recent_points=5):
         """
         AI에 전송할 데이터를 최적화하는 메서드.
@@ -357,23 +722,15 @@ class DataFetcher:
         
         optimized_data["bal"] = data_for_ai["balance"]
         optimized_data["charts"] = {}
+        optimized_data["summary"] = {}
 
-        for chart_key, chart_data in data_for_ai["chart_data"].items():
-            recent_chart_data = chart_data[-recent_points:]
-            optimized_chart = []
-            for entry in recent_chart_data:
-                # Date 컬럼 처리
-                date_val = (entry["Date"].strftime("%Y-%m-%d %H:%M:%S")
-                            if isinstance(entry["Date"], pd.Timestamp)
-                            else entry["Date"])
-                optimized_chart.append({
-                    "Date": date_val,
-                    "Close": entry["Close"],
-                    "Volume": entry["Volume"],
-                    "RSI14": round(entry.get("RSI14", 0), 2),
-                    "SMA20": round(entry.get("SMA20", 0), 2)
-                })
-            optimized_data["charts"][chart_key] = optimized_chart
+        # 최근 recent_points개 행만 잘라낸 뒤 컬럼별 리스트로 변환하고, 전체 구간은 요약 통계로 전달
+        for chart_key, df in data_for_ai["chart_data"].items():
+            optimized_data["summary"][chart_key] = self._summarize(df)
+            recent = (df.tail(recent_points)[["Date", "Close", "Volume", "RSI14", "SMA20"]]
+                      .round(PAYLOAD_DECIMALS)
+                      .fillna({"RSI14": 0, "SMA20": 0}))
+            optimized_data["charts"][chart_key] = self._to_columns(recent)
 
         optimized_data["fg"] = {
             "value": data_for_ai["fear_greed"].get("value", None),
@@ -392,41 +749,42 @@ class DataFetcher:
         """
         전체 데이터를 가져와 AI에게 넘길 데이터를 준비하는 메서드.
         """
-        # 1. 바이낸스 시세 불러오기
-        df_30, df_24h = self.fetch_binance_data()
-
-        # 2. 보조지표 계산
-        df_30, df_24h = self.compute_technical_indicators(df_30, df_24h)
-
-        # 3. 공포/탐욕 지수 가져오기
-        fear_greed = self.fetch_fear_greed_index()
-
-        # 4. 잔고 조회
-        balances = self.fetch_balances()
-
-        # 5. 뉴스 수집
-        crypto_news = self.fetch_crypto_news(limit=3)
-
-        # 6. 차트 이미지 캡처
-        chart_url = "https://upbit.com/full_chart?code=CRIX.UPBIT.KRW-BTC"
-        chart_image_path = self.capture_chart_image(url=chart_url, 
-                                            save_path="Captured_image/full_screenshot.png")
-
+        # 1~6. 서로 독립적인 작업(시세, 공포/탐욕 지수, 잔고, 뉴스, 차트 캡처)을 병렬로 실행
+        #      Selenium 캡처를 쓰는 경우 가장 오래 걸리므로 먼저 제출한다.
+        symbol = "BTCUSDT"
+        f_chart = None
+        if self.use_selenium_chart:
+            chart_url = "https://upbit.com/full_chart?code=CRIX.UPBIT.KRW-BTC"
+            f_chart = self._executor.submit(self.capture_chart_image, url=chart_url)
+        f_30 = self._executor.submit(self._get_chart, symbol, Client.KLINE_INTERVAL_1DAY, 30)
+        f_24h = self._executor.submit(self._get_chart, symbol, Client.KLINE_INTERVAL_1HOUR, 60)
+        f_fear_greed = self._executor.submit(self.fetch_fear_greed_index)
+        f_balances = self._executor.submit(self.fetch_balances)
+        f_news = self._executor.submit(self.fetch_crypto_news, limit=3)
+
+        df_30, df_24h = f_30.result(), f_24h.result()
+        fear_greed = f_fear_greed.result()
+        balances = f_balances.result()
+        crypto_news = f_news.result()
+        logging.info("바이낸스 데이터 및 보조지표 준비 완료.")
+
+        # 기본 경로: 이미 받은 1시간봉으로 차트를 직접 렌더링
+        chart_image = f_chart.result() if f_chart else self.render_chart_locally(df_24h)
 
         # 7. 데이터 구성
-        data_for_ai = self.prepare_data_for_ai(df_30, df_24h, fear_greed, balances, crypto_news, chart_image_path)
+        data_for_ai = self.prepare_data_for_ai(df_30, df_24h, fear_greed, balances, crypto_news, chart_image)
 
         return data_for_ai
 
 # -------------------- 모듈 직접 실행 시 -------------------- #
 if __name__ == "__main__":
     try:
-        fetcher = DataFetcher()
-        data_for_ai = fetcher.get_data_for_ai()
-        
-        # 예시: 데이터 최적화
-        optimized_data = fetcher.preprocess_data_for_api(data_for_ai, recent_points=5)
-        print("Optimized data ready for AI:", optimized_data)
+        with DataFetcher() as fetcher:
+            data_for_ai = fetcher.get_data_for_ai()
+
+            # 예시: 데이터 최적화
+            optimized_data = fetcher.preprocess_data_for_api(data_for_ai, recent_points=5)
+            print("Optimized data ready for AI:", optimized_data)
 
     except TypeError as te:
         print(f"TypeError 발생: {te}")
@@ -0,0 +1,152 @@
+# indicators.py
+import math
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    import talib
+except ImportError:  # TA-Lib(C 라이브러리)이 설치되지 않은 환경에서는 NumPy 구현 사용
+    talib = None
+
+
+def sma(close, period=20):
+    """
+    단순 이동평균(SMA)을 계산하는 함수. 앞쪽 period-1개 값은 NaN.
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    if talib is not None:
+        return talib.SMA(close, timeperiod=period)
+
+    out = np.full(close.shape, np.nan)
+    if close.size >= period:
+        out[period - 1:] = sliding_window_view(close, period).mean(axis=-1)
+    return out
+
+
+def _wilder_averages(gains, losses, period):
+    """
+    처음 period개 변화량의 단순 평균으로 시작해 Wilder 평활(alpha = 1/period)을 적용한
+    평균 상승폭/하락폭 배열을 반환하는 내부 헬퍼 함수.
+    """
+    avg_gains = np.empty(gains.size - period + 1)
+    avg_losses = np.empty_like(avg_gains)
+    avg_gains[0] = gains[:period].mean()
+    avg_losses[0] = losses[:period].mean()
+    for i in range(1, avg_gains.size):
+        avg_gains[i] = (avg_gains[i - 1] * (period - 1) + gains[period + i - 1]) / period
+        avg_losses[i] = (avg_losses[i - 1] * (period - 1) + losses[period + i - 1]) / period
+    return avg_gains, avg_losses
+
+
+def rsi(close, period=14):
+    """
+    Wilder 평활 RSI를 계산하는 함수. 앞쪽 period개 값은 NaN.
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    if talib is not None:
+        return talib.RSI(close, timeperiod=period)
+
+    out = np.full(close.shape, np.nan)
+    if close.size <= period:
+        return out
+
+    delta = np.diff(close)
+    gains = np.clip(delta, 0.0, None)
+    losses = np.clip(-delta, 0.0, None)
+
+    avg_gains, avg_losses = _wilder_averages(gains, losses, period)
+
+    total = avg_gains + avg_losses
+    out[period:] = np.divide(100.0 * avg_gains, total,
+                             out=np.zeros_like(total), where=total != 0)
+    return out
+
+
+class IncrementalIndicators:
+    """
+    RSI(Wilder 평활)와 SMA를 새 캔들 하나당 O(1)로 갱신하는 스트리밍 계산기.
+    확정된 종가는 update()로 반영하고, 진행 중인 캔들은 peek()으로 상태 변경 없이 계산한다.
+    초기값 계산 방식은 TA-Lib의 RSI/SMA와 동일하다.
+    """
+
+    def __init__(self, rsi_period=14, sma_period=20):
+        self.rsi_period = rsi_period
+        self.sma_period = sma_period
+
+        # SMA 상태: 최근 sma_period개 종가와 그 합
+        self._window = deque(maxlen=sma_period)
+        self._window_sum = 0.0
+
+        # RSI 상태: 직전 종가, 초기 평균용 변화량, Wilder 평균 상승/하락폭
+        self._prev_close = None
+        self._seed_deltas = []
+        self._avg_gain = None
+        self._avg_loss = None
+
+    @classmethod
+    def from_closes(cls, closes, rsi_period=14, sma_period=20):
+        """
+        종가 시퀀스 전체를 순서대로 반영한 계산기를 생성하는 메서드.
+        """
+        indicators = cls(rsi_period, sma_period)
+        for close in closes:
+            indicators.update(close)
+        return indicators
+
+    def peek(self, close):
+        """
+        상태를 바꾸지 않고, close가 다음 캔들의 종가일 때의 (rsi, sma)를 반환하는 메서드.
+        """
+        rsi, sma, _ = self._next_state(float(close))
+        return rsi, sma
+
+    def update(self, close):
+        """
+        확정된 종가 하나를 반영하고 (rsi, sma)를 반환하는 메서드.
+        """
+        close = float(close)
+        rsi, sma, (window_sum, delta, avg_gain, avg_loss) = self._next_state(close)
+
+        self._window.append(close)
+        self._window_sum = window_sum
+        if delta is not None and avg_gain is None:
+            self._seed_deltas.append(delta)
+        self._avg_gain = avg_gain
+        self._avg_loss = avg_loss
+        self._prev_close = close
+        return rsi, sma
+
+    def _next_state(self, close):
+        """
+        다음 종가에 대한 지표 값과 갱신될 상태를 계산하는 내부 헬퍼 메서드.
+        """
+        # SMA: 가장 오래된 값을 빼고 새 값을 더한다
+        window_sum = self._window_sum + close
+        count = len(self._window) + 1
+        if len(self._window) == self.sma_period:
+            window_sum -= self._window[0]
+            count -= 1
+        sma = window_sum / count if count == self.sma_period else math.nan
+
+        if self._prev_close is None:
+            return math.nan, sma, (window_sum, None, None, None)
+
+        # RSI: 처음 n개 변화량의 단순 평균으로 시작해 Wilder 평활 적용
+        n = self.rsi_period
+        delta = close - self._prev_close
+        gain, loss = max(delta, 0.0), max(-delta, 0.0)
+        if self._avg_gain is not None:
+            avg_gain = (self._avg_gain * (n - 1) + gain) / n
+            avg_loss = (self._avg_loss * (n - 1) + loss) / n
+        elif len(self._seed_deltas) + 1 == n:
+            deltas = self._seed_deltas + [delta]
+            avg_gain = sum(d for d in deltas if d > 0) / n
+            avg_loss = -sum(d for d in deltas if d < 0) / n
+        else:
+            return math.nan, sma, (window_sum, delta, None, None)
+
+        total = avg_gain + avg_loss
+        rsi = 100.0 * avg_gain / total if total != 0 else 0.0
+        return rsi, sma, (window_sum, delta, avg_gain, avg_loss)
@@ -1,10 +1,11 @@
 # main.py
 import time
+import asyncio
 import data_fetcher
 import openai_trader  # Vision API 호출도 이쪽에서 진행
 import logging
-import json
 import os
+from binance import ThreadedWebsocketManager
 from dotenv import load_dotenv
 
 # .env 파일 로드
@@ -17,49 +18,101 @@ logging.basicConfig(
     format='%(asctime)s %(levelname)s:%(message)s'
 )
 
-def main_loop(interval_minutes=30):
+def start_kline_stream(loop, queue, symbol="BTCUSDT", interval="30m"):
     """
-    Main loop for auto trading.
-    1. 데이터 수집 (data_fetcher)
-    2. openai_trader.get_ai_decision_with_chart()로 Vision API에 데이터 전송해 매매 결정 받기
-    3. 결정에 따라 매매 실행
-    4. 일정 시간 대기 후 반복
+    바이낸스 kline 웹소켓을 별도 스레드에서 시작하고, 캔들이 마감될 때마다 메시지를 queue에 넣는 함수.
+    콜백은 웹소켓 스레드에서 실행되므로 call_soon_threadsafe로 이벤트 루프에 전달한다.
     """
-    interval_seconds = interval_minutes * 60
-    while True:
-        try:
-            print("\n=== 데이터 수집 및 매매 실행 시작 ===")
-            logging.info("데이터 수집 및 매매 실행 시작.")
+    twm = ThreadedWebsocketManager()
+    twm.start()
 
-            # 1. 데이터 가져오기
-            data_for_ai = data_fetcher.get_data_for_ai()
+    def _on_kline(msg):
+        if msg.get("e") == "error":
+            logging.error(f"kline 웹소켓 오류: {msg.get('m')}")
+            return
+        # k.x == True: 캔들 마감
+        if msg.get("k", {}).get("x"):
+            loop.call_soon_threadsafe(queue.put_nowait, msg)
+
+    twm.start_kline_socket(callback=_on_kline, symbol=symbol, interval=interval)
+    logging.info(f"{symbol} {interval} kline 웹소켓 구독 시작.")
+    return twm
+
+async def run_cycle(fetcher):
+    """
+    데이터 수집 -> AI 결정 -> 매매 실행을 한 번 수행하는 코루틴.
+    오류가 나도 다음 사이클이 계속 돌 수 있도록 예외는 여기서 기록만 한다.
+    """
+    try:
+        print("\n=== 데이터 수집 및 매매 실행 시작 ===")
+        logging.info("데이터 수집 및 매매 실행 시작.")
 
-            # 2. 데이터 최적화
-            optimized_data = data_fetcher.preprocess_data_for_api(data_for_ai, recent_points=5)
+        # 1. 데이터 가져오기
+        data_for_ai = await asyncio.to_thread(fetcher.get_data_for_ai)
 
-            # 3. Vision API 호출: buy/sell/hold 결정 받기
-            decision, reason = openai_trader.get_ai_decision_with_chart(optimized_data)
-            logging.info(f"AI 결정: {decision}, 이유: {reason}")
+        # 2. 데이터 최적화
+        optimized_data = await asyncio.to_thread(
+            fetcher.preprocess_data_for_api, data_for_ai, recent_points=5
+        )
 
-            # 4. 매매 실행
-            openai_trader.execute_trade(decision, reason)
+        # 3. Vision API 스트리밍 호출 + 매매 실행
+        #    decision 값이 스트림에 나오는 즉시 주문을 시작하고, reason은 응답이 끝난 뒤 기록
+        decision, reason = await openai_trader.execute_trade_streaming(optimized_data)
+        logging.info(f"AI 결정: {decision}, 이유: {reason}")
 
-            # 5. 대기
-            print(f">>> Sleep for {interval_minutes} minutes ({interval_seconds} seconds)")
-            logging.info(f"Sleep for {interval_minutes} minutes.")
-            time.sleep(interval_seconds)
+    except Exception as e:
+        print(f"메인 루프에서 오류 발생: {e}")
+        logging.error(f"메인 루프에서 오류 발생: {e}")
 
-        except KeyboardInterrupt:
-            print("\n자동 매매를 중지합니다.")
-            logging.info("자동 매매 중지.")
-            break
+async def main_loop(interval_minutes=30, use_websocket=True):
+    """
+    Main loop for auto trading.
+    1. 데이터 수집 (data_fetcher)
+    2. openai_trader.execute_trade_streaming()으로 Vision API에 데이터 전송해 매매 결정 받기
+    3. 결정이 스트림에 나오는 즉시 매매 실행
+    4. 다음 캔들 마감까지 대기 후 반복
+    use_websocket=True이면 바이낸스 kline 웹소켓({interval_minutes}m 캔들)의 마감 이벤트마다 사이클을 실행하고,
+    False이면 interval_minutes 간격으로 폴링한다. interval_minutes는 바이낸스 분봉 간격(1, 3, 5, 15, 30)이어야 한다.
+    """
+    interval_seconds = interval_minutes * 60
+    twm = None
+    try:
+        with data_fetcher.DataFetcher() as fetcher:
+            if use_websocket:
+                candle_closed = asyncio.Queue()
+                twm = await asyncio.to_thread(
+                    start_kline_stream, asyncio.get_running_loop(), candle_closed,
+                    interval=f"{interval_minutes}m"
+                )
+                # 같은 웹소켓 매니저로 호가를 구독해 주문 직전 시세 조회(REST)를 생략
+                openai_trader.start_book_ticker_stream(twm)
+                while True:
+                    # 캔들이 마감될 때까지 대기 (폴링 없음). 사이클 중 마감된 캔들은 큐에 쌓여 순서대로 처리
+                    msg = await candle_closed.get()
+                    logging.info(f"캔들 마감 이벤트 수신: {msg['k']['s']} {msg['k']['i']} (종가 {msg['k']['c']})")
+                    await run_cycle(fetcher)
+            else:
+                # 고정 간격 스케줄링: 사이클 실행 시간만큼 대기 시간을 줄여 시작 시각이 밀리지 않게 한다
+                deadline = time.monotonic()
+                while True:
+                    await run_cycle(fetcher)
 
-        except Exception as e:
-            print(f"메인 루프에서 오류 발생: {e}")
-            logging.error(f"메인 루프에서 오류 발생: {e}")
-            print(f">>> Sleep for {interval_minutes} minutes before retrying.")
-            logging.info(f"Sleep for {interval_minutes} minutes before retrying due to error.")
-            time.sleep(interval_seconds)
+                    # 4. 다음 시작 시각까지 대기 (사이클이 간격보다 오래 걸렸으면 밀린 회차는 건너뛰고 바로 시작)
+                    deadline += interval_seconds
+                    delay = deadline - time.monotonic()
+                    if delay < 0:
+                        logging.warning(f"사이클이 간격보다 {-delay:.1f}초 오래 걸렸습니다.")
+                        deadline, delay = time.monotonic(), 0
+                    print(f">>> Sleep for {delay:.0f} seconds until next cycle")
+                    logging.info(f"Sleep for {delay:.0f} seconds until next cycle.")
+                    await asyncio.sleep(delay)
+    finally:
+        if twm is not None:
+            twm.stop()
 
 if __name__ == "__main__":
-    main_loop(30)  # 30분 간격
+    try:
+        asyncio.run(main_loop(30))  # 30분봉 마감마다 실행
+    except KeyboardInterrupt:
+        print("\n자동 매매를 중지합니다.")
+        logging.info("자동 매매 중지.")
@@ -1,20 +1,97 @@
 import os
-import json
+import re
+import math
+import time
+import asyncio
+import hashlib
+import threading
 import logging
+import orjson
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
 from binance.client import Client
+from binance.exceptions import BinanceAPIException
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from rate_limiter import BinanceWeightGuard, HeaderAwareRateLimiter, binance_weight
+
 import openai
 
+try:
+    import h2  # HTTP/2 백엔드 (httpx[http2])
+except ImportError:  # h2가 없으면 HTTP/1.1 keep-alive 연결 풀만 사용
+    h2 = None
+
 load_dotenv()
 
 # 바이낸스 API 키 로드
 BINANCE_API_KEY = os.getenv("BINANCE_API_KEY")
 BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET")
 
-# 바이낸스 클라이언트 초기화 (Spot + Futures 겸용)
-# 하나의 Client로도 선물 주문이 가능합니다.
-client = Client(BINANCE_API_KEY, BINANCE_API_SECRET)
+# 매매 결정용 모델 (기본: 저렴하고 빠른 gpt-4o-mini, 비교가 필요하면 OAI_MODEL=gpt-4o 등으로 변경)
+MODEL = os.getenv("OAI_MODEL", "gpt-4o-mini")
+
+# 매매 결정은 trade 함수 호출(function calling)로만 받는다.
+# 스키마로 decision 값을 제한하고 tool_choice로 호출을 강제해, 자유 형식 텍스트 없이 JSON 인자만 생성된다.
+TRADE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "trade",
+        "description": "Submit the trading decision for the analysed market data.",
+        "strict": True,
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "decision": {"type": "string", "enum": ["long", "short", "buy", "sell", "hold"]},
+                "reason": {"type": "string", "description": "One short technical reason (under 140 characters)."}
+            },
+            "required": ["decision", "reason"],
+            "additionalProperties": False
+        }
+    }
+}
+# 요청마다 동일한 앞부분(도구 정의 + 시스템 프롬프트)은 OpenAI 자동 프롬프트 캐시(1024 토큰 이상)에 걸리도록
+# 바뀌지 않게 유지하고, 같은 캐시 키로 보내 같은 서버로 라우팅되게 한다
+PROMPT_CACHE_KEY = "btc-trader-decision-v1"
+TOOLS = [TRADE_TOOL]
+DECISION_TOOL_ARGS = {
+    "tools": TOOLS,
+    "tool_choice": {"type": "function", "function": {"name": "trade"}},
+    "prompt_cache_key": PROMPT_CACHE_KEY
+}
+
+# 응답에 설명 문장이 섞여 있을 때 "decision"이 들어 있는 첫 JSON 객체만 골라내기 위한 정규식
+_JSON_RE = re.compile(r'\{[^{}]*"decision"[^{}]*\}', re.DOTALL)
+# 스트리밍 중 reason이 끝나기 전에 decision 값만 먼저 찾아내기 위한 정규식
+_DECISION_RE = re.compile(r'"decision"\s*:\s*"(long|short|buy|sell|hold)"', re.IGNORECASE)
+
+# AI 결정 캐시: 거의 같은 데이터가 DECISION_CACHE_TTL 초 안에 다시 들어오면 API 호출 없이 직전 결정을 재사용.
+# 키에 캔들 시각(Date)이 들어가므로 1분 미만 간격으로 호출하는 경우에만 적중하고, 30분 주기 루프에서는 적중하지 않는다
+DECISION_CACHE_TTL = 60
+DECISION_CACHE_SIZE = 128
+# 캐시 키를 만들 때 필드별 반올림 자릿수 (가격 계열은 10 USDT 단위, RSI는 정수 단위)
+DECISION_CACHE_ROUNDING = {
+    "Close": -1, "SMA20": -1, "mean": -1, "std": -1, "high": -1, "low": -1,
+    "RSI14": 0,
+}
+_decision_cache = OrderedDict()  # key -> (decision, reason, 저장 시각)
+_decision_cache_lock = threading.Lock()
+
+# 시스템 프롬프트 파일 (없거나 읽을 수 없으면 DEFAULT_SYSTEM_PROMPT 사용)
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gpt_prompt.txt")
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a crypto trading assistant with vision. "
+    "Analyze the user-provided chart image and other data, then decide: long/short/buy/sell/hold."
+)
+# 파일 수정 시각(mtime)이 바뀔 때만 다시 읽는다 (system 메시지 dict도 함께 만들어 두고 매 요청 재사용)
+_prompt_cache = {
+    "mtime": None,
+    "text": DEFAULT_SYSTEM_PROMPT,
+    "message": {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+}
 
 # 로깅 설정
 logging.basicConfig(
@@ -23,108 +100,244 @@ logging.basicConfig(
     format='%(asctime)s %(levelname)s:%(message)s'
 )
 
-def calculate_order_quantity(symbol, usdt_amount):
+# OpenAI 비동기 요청용 rate limiter (응답 헤더의 남은 한도를 따라 자동 조절)
+_openai_limiter = HeaderAwareRateLimiter(max_concurrent=8, requests_per_minute=500)
+RATE_LIMIT_RETRIES = 3  # 429를 받았을 때 retry-after만큼 쉬고 다시 요청하는 최대 횟수
+
+# 선물 API(fapi)는 현물과 별도로 IP당 1분 가중치 2400을 사용 (현물은 rate_limiter.binance_weight 공유)
+_futures_weight = BinanceWeightGuard(weight_limit=2400)
+
+# 서로 독립적인 바이낸스 REST 호출을 동시에 보내기 위한 스레드 풀
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="openai_trader")
+
+@lru_cache(maxsize=1)
+def _get_openai_client():
+    """
+    OpenAI 클라이언트를 처음 필요할 때 한 번만 생성하는 함수.
+    하나의 클라이언트를 재사용해 내부 HTTP 연결 풀(keep-alive)을 공유한다.
+    """
+    return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+@lru_cache(maxsize=1)
+def _get_async_openai_client():
+    """
+    여러 요청을 동시에 보내기 위한 AsyncOpenAI 클라이언트를 한 번만 생성하는 함수.
+    SDK 기본 연결 풀(keep-alive)을 그대로 쓰고, h2가 설치되어 있으면 HTTP/2 연결 하나에 동시 요청을 다중화한다.
+    """
+    http_client = openai.DefaultAsyncHttpxClient(http2=h2 is not None)
+    return openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+
+@lru_cache(maxsize=1)
+def _get_client():
+    """
+    바이낸스 클라이언트(Spot + Futures 겸용)를 처음 필요할 때 한 번만 생성하는 함수.
+    Client 생성 시 서버 ping이 발생하므로 import 시점에는 만들지 않는다.
+    하나의 Client로도 선물 주문이 가능합니다.
+    """
+    client = Client(BINANCE_API_KEY, BINANCE_API_SECRET, requests_params={"timeout": 10})
+    # 주문/잔고/시세 호출이 같은 호스트로 연달아 나가므로 연결 풀을 키워 TCP/TLS 연결을 재사용
+    client.session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=3))
+    client.session.headers.update({"Connection": "keep-alive"})
+    client.session.hooks["response"].append(_track_binance_weight)
+    return client
+
+def _track_binance_weight(response, *args, **kwargs):
+    """
+    바이낸스 클라이언트 세션의 response 훅. 응답의 1분 사용 가중치를 현물/선물 guard에 반영한다.
+    """
+    guard = _futures_weight if urlsplit(response.url).netloc.startswith("fapi.") else binance_weight
+    guard.update_from_headers(response.headers)
+
+def _lot_size(step_size, min_qty):
+    """
+    LOT_SIZE 값으로 (step_size, min_qty, qty_precision)을 만드는 함수.
+    qty_precision은 step_size의 소수점 자릿수 (예: 0.001 -> 3).
+    """
+    step_size, min_qty = float(step_size), float(min_qty)
+    qty_precision = max(0, int(round(-math.log10(step_size))))
+    return step_size, min_qty, qty_precision
+
+def _floor_to_step(quantity, step_size, qty_precision):
+    """
+    수량을 step_size 배수로 내림하고 qty_precision 자리로 반올림해 float 오차를 제거하는 함수.
+    """
+    # quantity / step_size가 2.9999999999999996처럼 나오는 경우를 막기 위해 먼저 반올림 후 내림
+    steps = math.floor(round(quantity / step_size, 9))
+    return round(steps * step_size, qty_precision)
+
+# bookTicker 웹소켓으로 받은 최신 가격 {symbol: (가격, 수신 시각)}. PRICE_MAX_AGE초보다 오래되면 REST로 조회
+PRICE_MAX_AGE = 5  # 초
+_last_prices = {}
+
+# 이미 ISOLATED 마진 / 레버리지 설정을 마친 선물 심볼 (프로세스 동안 유지)
+_margin_configured = set()
+_leverage_set = set()
+
+# Futures 심볼별 LOT_SIZE 필터 캐시 (futures_exchange_info 한 번으로 전체 심볼을 채움)
+FUTURES_FILTERS_TTL = 3600  # 초
+_futures_filters = {}
+_futures_filters_at = 0.0
+_futures_filters_lock = threading.Lock()
+
+@lru_cache(maxsize=32)
+def _symbol_filters(symbol):
+    """
+    Spot 심볼의 LOT_SIZE 필터 (step_size, min_qty, qty_precision)를 조회하는 함수.
+    거래 규칙은 실행 중에 거의 바뀌지 않으므로 심볼별로 한 번만 조회해 캐시한다.
+    """
+    # 심볼 정보 조회 (Spot 기준)
+    symbol_info = _get_client().get_symbol_info(symbol)
+    for f in symbol_info['filters']:
+        if f['filterType'] == 'LOT_SIZE':
+            return _lot_size(f['stepSize'], f['minQty'])
+    return _lot_size(0.000001, 0.000001)
+
+def _futures_symbol_filters(symbol):
+    """
+    Futures 심볼의 LOT_SIZE 필터 (step_size, min_qty, qty_precision)를 조회하는 함수.
+    futures_exchange_info는 전체 심볼 정보(수백 KB)를 내려주므로, 한 번 받을 때 모든 심볼을
+    _futures_filters에 채워 두고 FUTURES_FILTERS_TTL 동안은 dict 조회만 한다.
+    """
+    global _futures_filters_at
+    with _futures_filters_lock:
+        if not _futures_filters or time.monotonic() - _futures_filters_at >= FUTURES_FILTERS_TTL:
+            # python-binance >= 1.0.10 이상 버전이면 아래처럼 futures_exchange_info 사용 가능
+            futures_info = _get_client().futures_exchange_info()
+            filters = {}
+            for sinfo in futures_info["symbols"]:
+                for filt in sinfo["filters"]:
+                    if filt["filterType"] == "LOT_SIZE":
+                        filters[sinfo["symbol"]] = _lot_size(filt["stepSize"], filt["minQty"])
+                        break
+            _futures_filters.clear()
+            _futures_filters.update(filters)
+            _futures_filters_at = time.monotonic()
+        return _futures_filters.get(symbol) or _lot_size(0.000001, 0.000001)
+
+def calculate_order_quantity(symbol, usdt_amount, current_price, step_size, min_qty, qty_precision=8):
     """
     Spot 매수시, 지정된 USDT 금액으로 매수할 수 있는 BTC 수량을 계산하는 함수.
     바이낸스의 최소 주문 단위를 고려합니다.
+    시세와 LOT_SIZE 필터는 호출하는 쪽에서 이미 조회한 값을 넘겨받으므로 API 호출이 없습니다.
     """
     try:
-        # 심볼 정보 조회 (Spot 기준)
-        symbol_info = client.get_symbol_info(symbol)
-        step_size = 0.000001
-        min_qty = 0.000001
-        for f in symbol_info['filters']:
-            if f['filterType'] == 'LOT_SIZE':
-                step_size = float(f['stepSize'])
-                min_qty = float(f['minQty'])
-                break
-
-        ticker = client.get_symbol_ticker(symbol=symbol)
-        current_price = float(ticker['price']) if 'price' in ticker else 0
         if current_price == 0:
             return 0
 
-        quantity = usdt_amount / current_price
-        quantity = (quantity // step_size) * step_size
+        quantity = _floor_to_step(usdt_amount / current_price, step_size, qty_precision)
 
         if quantity < min_qty:
-            logging.warning(f"매수하려는 수량 {quantity} BTC가 최소 주문 수량 {min_qty}보다 작습니다.")
+            logging.warning(f"{symbol} 매수하려는 수량 {quantity}가 최소 주문 수량 {min_qty}보다 작습니다.")
             return 0
 
-        return round(quantity, 8)
+        return quantity
     except Exception as e:
         logging.error(f"Spot 매수 수량 계산 중 오류 발생: {e}")
         return 0
 
-def calculate_futures_quantity(symbol, usdt_amount):
+def calculate_futures_quantity(symbol, usdt_amount, current_price, step_size, min_qty, qty_precision=8):
     """
     Futures (선물) 롱/숏 진입시, 지정된 USDT 금액을 활용해 시장가로 진입할 때의 계약 수량을 추정.
     바이낸스 선물 거래는 '거래 단위'가 현물과 같지만(1 BTC), 
     레버리지 고려 시 자금 대비 포지션 규모가 달라질 수 있음.
     여기서는 레버리지 1배이므로 Spot 계산과 거의 유사하지만,
     별도의 최소 수량/스텝 사이즈가 존재합니다.
+    시세와 LOT_SIZE 필터는 호출하는 쪽에서 이미 조회한 값을 넘겨받으므로 API 호출이 없습니다.
     """
     try:
-        # 선물 심볼 정보 조회 (Futures API)
-        # python-binance >= 1.0.10 이상 버전이면 아래처럼 futures_exchange_info 사용 가능
-        futures_info = client.futures_exchange_info()
-        step_size = 0.000001
-        min_qty = 0.000001
-
-        for sinfo in futures_info["symbols"]:
-            if sinfo["symbol"] == symbol:
-                for filt in sinfo["filters"]:
-                    if filt["filterType"] == "LOT_SIZE":
-                        step_size = float(filt["stepSize"])
-                        min_qty = float(filt["minQty"])
-                break
-
-        # 현재 선물 가격 조회 (공유된 티커를 그대로 사용 가능)
-        # BTCUSDT 선물은 스펙상 현물과 거의 동일한 가격 참조
-        ticker = client.futures_symbol_ticker(symbol=symbol)
-        current_price = float(ticker['price']) if 'price' in ticker else 0
         if current_price == 0:
             return 0
 
         # 1배 레버리지는 Spot과 동일하지만, 여기선 같은 로직으로 계산
-        quantity = usdt_amount / current_price
-        quantity = (quantity // step_size) * step_size
+        quantity = _floor_to_step(usdt_amount / current_price, step_size, qty_precision)
 
         if quantity < min_qty:
-            logging.warning(f"선물 포지션 진입수량 {quantity} BTC < 최소 주문수량 {min_qty}.")
+            logging.warning(f"{symbol} 선물 포지션 진입수량 {quantity} < 최소 주문수량 {min_qty}.")
             return 0
 
-        return round(quantity, 8)
+        return quantity
     except Exception as e:
         logging.error(f"Futures 포지션 수량 계산 오류: {e}")
         return 0
 
-def set_isolated_margin_and_leverage(symbol):
+def set_isolated_margin_and_leverage(symbol, leverage=1):
     """
     Futures에 대해 Isolated 모드와 레버리지를 x1로 설정하는 함수.
     이미 이 설정이 되어있으면 오류가 발생할 수 있으니, 예외처리로 잡음.
+    설정은 거의 바뀌지 않으므로 성공한 심볼/레버리지는 기억해 두고 다음 진입부터는 API를 호출하지 않는다.
     """
-    try:
-        # 마진 모드 설정
-        client.futures_change_margin_type(
-            symbol=symbol,
-            marginType="ISOLATED"
-        )
-        logging.info(f"{symbol} 선물 마진모드: ISOLATED 설정 완료.")
-    except Exception as e:
-        logging.warning(f"{symbol} 선물 마진모드 설정 중 오류/이미 설정됨: {e}")
+    if symbol in _margin_configured and (symbol, leverage) in _leverage_set:
+        return
+
+    client = _get_client()
+    if symbol not in _margin_configured:
+        try:
+            # 마진 모드 설정
+            client.futures_change_margin_type(
+                symbol=symbol,
+                marginType="ISOLATED"
+            )
+            _margin_configured.add(symbol)
+            logging.info(f"{symbol} 선물 마진모드: ISOLATED 설정 완료.")
+        except BinanceAPIException as e:
+            if e.code == -4046:  # No need to change margin type: 이미 ISOLATED
+                _margin_configured.add(symbol)
+            logging.warning(f"{symbol} 선물 마진모드 설정 중 오류/이미 설정됨: {e}")
+        except Exception as e:
+            logging.warning(f"{symbol} 선물 마진모드 설정 중 오류/이미 설정됨: {e}")
+
+    if (symbol, leverage) not in _leverage_set:
+        try:
+            # 레버리지 설정 (1배)
+            client.futures_change_leverage(
+                symbol=symbol,
+                leverage=leverage
+            )
+            _leverage_set.add((symbol, leverage))
+            logging.info(f"{symbol} 레버리지 {leverage}배 설정 완료.")
+        except Exception as e:
+            logging.warning(f"{symbol} 레버리지 설정 중 오류/이미 설정됨: {e}")
+
+def start_book_ticker_stream(twm, symbol="BTCUSDT"):
+    """
+    이미 시작된 ThreadedWebsocketManager에 bookTicker 스트림을 구독해 최신 가격을 메모리에 유지하는 함수.
+    구독 중에는 execute_trade가 시세 REST 호출 없이 이 가격을 사용한다.
+    """
+    def _on_book_ticker(msg):
+        if msg.get("e") == "error":
+            logging.error(f"bookTicker 웹소켓 오류: {msg.get('m')}")
+            return
+        # 최우선 매수/매도 호가의 중간값
+        _last_prices[msg["s"]] = ((float(msg["b"]) + float(msg["a"])) / 2, time.monotonic())
 
-    try:
-        # 레버리지 설정 (1배)
-        client.futures_change_leverage(
-            symbol=symbol,
-            leverage=1
-        )
-        logging.info(f"{symbol} 레버리지 1배 설정 완료.")
-    except Exception as e:
-        logging.warning(f"{symbol} 레버리지 설정 중 오류/이미 설정됨: {e}")
+    twm.start_symbol_book_ticker_socket(callback=_on_book_ticker, symbol=symbol)
+    logging.info(f"{symbol} bookTicker 웹소켓 구독 시작.")
 
-def execute_trade(decision, reason, symbol="BTCUSDT"):
+def _streamed_price(symbol):
+    """
+    bookTicker 웹소켓으로 받은 최신 가격을 반환하는 함수. 구독 전이거나 오래된 값이면 None.
+    """
+    entry = _last_prices.get(symbol)
+    if entry is not None and time.monotonic() - entry[1] < PRICE_MAX_AGE:
+        return entry[0]
+    return None
+
+def _futures_usdt_balance():
+    """
+    선물 지갑에서 주문에 쓸 수 있는 USDT 잔고를 조회하는 함수.
+    """
+    for bal in _get_client().futures_account_balance():
+        if bal['asset'] == "USDT":
+            return float(bal['availableBalance'])
+    return 0.0
+
+def _reason_text(reason):
+    """
+    reason이 Future(아직 생성 중인 이유)이면 완료될 때까지 기다려 문자열로 반환하는 함수.
+    """
+    return reason.result() if isinstance(reason, Future) else reason
+
+def execute_trade(decision, reason, symbol="BTCUSDT", price=None):
     """
     다섯 가지 결정 (long, short, buy, sell, hold)에 따라 
     BTCUSDT 선물 혹은 현물 거래를 실행한다.
@@ -132,13 +345,38 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
     
     Parameters:
         decision (str): "long", "short", "buy", "sell", "hold"
-        reason (str): 매매 결정 이유
+        reason (str | Future): 매매 결정 이유 (스트리밍 중이면 완료 시 이유가 채워지는 Future)
         symbol (str): 기본값 "BTCUSDT"
+        price (float): 이미 알고 있는 현재가. 주거나 bookTicker 스트림 가격이 있으면 시세 조회를 생략한다.
     """
+    # 가중치 한도에 가까우면 429/418(IP 차단)을 받기 전에 다음 분까지 기다린 뒤 주문 (최대 60초)
+    delay = binance_weight.paused_for()
+    if decision in ("long", "short"):
+        delay = max(delay, _futures_weight.paused_for())
+    if delay:
+        logging.warning(f"바이낸스 가중치 한도 근접: {delay:.1f}초 대기 후 {decision} 실행")
+        time.sleep(delay)
+
     try:
+        client = _get_client()
+        if price is None:
+            price = _streamed_price(symbol)
+        # 주문에 쓸 현재가와 LOT_SIZE 필터(선물/현물)는 잔고 조회와 독립적이므로 스레드 풀에서 동시에 요청
+        # 현물/선물(BTCUSDT 무기한) 가격 차이는 수량 계산에 영향이 없을 만큼 작으므로 현물 시세 하나를 같이 사용
+        f_ticker = f_filters = f_futures_balance = f_margin = None
+        if decision in ("long", "short"):
+            # 마진/레버리지 설정도 시세/필터 조회와 독립적이므로 함께 시작 (이미 설정된 심볼은 즉시 반환)
+            f_margin = _executor.submit(set_isolated_margin_and_leverage, symbol)
+            f_filters = _executor.submit(_futures_symbol_filters, symbol)
+            f_futures_balance = _executor.submit(_futures_usdt_balance)
+        elif decision in ("buy", "sell"):
+            f_filters = _executor.submit(_symbol_filters, symbol)
+        if decision in ("long", "short", "buy") and price is None:
+            f_ticker = _executor.submit(client.get_symbol_ticker, symbol=symbol)
+
         # 공통: Spot 계좌 잔고, Futures 지갑 잔고 등을 각각 조회할 수도 있음
         # 일단은 Spot 잔고만 예시로 가져옴
-        account_info = client.get_account()
+        account_info = client.get_account(omitZeroBalances="true")
         balances = {
             bal['asset']: float(bal['free'])
             for bal in account_info['balances']
@@ -146,19 +384,24 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
         }
         my_usdt_spot = balances.get("USDT", 0)
 
-        # 선물 지갑 잔고 조회 (Futures)
-        # 예: client.futures_account_balance() 등
-        # 여기선 간단히 임의로 100 USDT 있다고 가정
-        my_usdt_futures = 100.0
+        # 선물 지갑 잔고 조회 (Futures): 선물 진입할 때만 조회
+        my_usdt_futures = f_futures_balance.result() if f_futures_balance is not None else 0.0
+
+        current_price, step_size, min_qty, qty_precision = price or 0, 0.000001, 0.000001, 6
+        if f_ticker is not None:
+            ticker = f_ticker.result()
+            current_price = float(ticker['price']) if 'price' in ticker else 0
+        if f_filters is not None:
+            step_size, min_qty, qty_precision = f_filters.result()
 
         # =========================
         # 1) LONG 포지션 진입
         # =========================
         if decision == "long":
-            set_isolated_margin_and_leverage(symbol)
+            f_margin.result()
             # USDT를 얼마나 사용할지 결정 (예: 전액 or 일부)
-            use_amount = my_usdt_futures  # 예: 100 USDT 전부
-            qty = calculate_futures_quantity(symbol, use_amount)
+            use_amount = my_usdt_futures  # 예: 선물 지갑 USDT 전부
+            qty = calculate_futures_quantity(symbol, use_amount, current_price, step_size, min_qty, qty_precision)
             if qty > 0:
                 print(">>> LONG (Futures) BTCUSDT")
                 try:
@@ -172,7 +415,7 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
                     )
                     logging.info(f"롱 포지션 주문 실행: {order}")
                     print(order)
-                    print("long reason:", reason)
+                    print("long reason:", _reason_text(reason))
                 except Exception as e:
                     logging.error(f"롱 포지션 주문 오류: {e}")
                     print(f"롱 포지션 주문 오류: {e}")
@@ -184,9 +427,9 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
         # 2) SHORT 포지션 진입
         # =========================
         elif decision == "short":
-            set_isolated_margin_and_leverage(symbol)
+            f_margin.result()
             use_amount = my_usdt_futures
-            qty = calculate_futures_quantity(symbol, use_amount)
+            qty = calculate_futures_quantity(symbol, use_amount, current_price, step_size, min_qty, qty_precision)
             if qty > 0:
                 print(">>> SHORT (Futures) BTCUSDT")
                 try:
@@ -200,7 +443,7 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
                     )
                     logging.info(f"숏 포지션 주문 실행: {order}")
                     print(order)
-                    print("short reason:", reason)
+                    print("short reason:", _reason_text(reason))
                 except Exception as e:
                     logging.error(f"숏 포지션 주문 오류: {e}")
                     print(f"숏 포지션 주문 오류: {e}")
@@ -214,7 +457,7 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
         elif decision == "buy":
             # 현물 계좌 USDT 잔고가 10 USDT 이상일 때 매수
             if my_usdt_spot >= 10:
-                qty = calculate_order_quantity(symbol, my_usdt_spot * 0.9995)
+                qty = calculate_order_quantity(symbol, my_usdt_spot * 0.9995, current_price, step_size, min_qty, qty_precision)
                 if qty > 0:
                     print(">>> BUY (Spot) BTCUSDT")
                     try:
@@ -224,7 +467,7 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
                         )
                         logging.info(f"현물 매수 주문 실행: {buy_order}")
                         print(buy_order)
-                        print("buy reason:", reason)
+                        print("buy reason:", _reason_text(reason))
                     except Exception as e:
                         logging.error(f"현물 매수 주문 오류: {e}")
                         print(f"현물 매수 주문 오류: {e}")
@@ -241,28 +484,33 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
         elif decision == "sell":
             # 현물 계좌 BTC 잔고 조회
             my_btc_spot = balances.get("BTC", 0)
-            if my_btc_spot >= 0.0001:
+            # 잔고를 그대로 주문하면 LOT_SIZE 위반으로 거절되므로 step_size 배수로 내림
+            qty = _floor_to_step(my_btc_spot, step_size, qty_precision)
+            if my_btc_spot >= 0.0001 and qty >= min_qty:
                 print(">>> SELL (Spot) BTCUSDT")
                 try:
                     sell_order = client.order_market_sell(
                         symbol=symbol,
-                        quantity=my_btc_spot
+                        quantity=qty
                     )
                     logging.info(f"현물 매도 주문 실행: {sell_order}")
                     print(sell_order)
-                    print("sell reason:", reason)
+                    print("sell reason:", _reason_text(reason))
                 except Exception as e:
                     logging.error(f"현물 매도 주문 오류: {e}")
                     print(f"현물 매도 주문 오류: {e}")
-            else:
+            elif my_btc_spot < 0.0001:
                 print("매도불가: 보유 BTC가 0.0001 미만.")
                 logging.info("매도 조건 미충족: BTC 잔고 부족.")
+            else:
+                print(f"매도불가: 주문 가능 수량 {qty}가 최소 주문 수량 {min_qty} 미만.")
+                logging.info(f"매도 조건 미충족: 주문 가능 수량 {qty} < 최소 주문 수량 {min_qty}.")
 
         # =========================
         # 5) HOLD
         # =========================
         else:
-            print("hold:", reason)
+            print("hold:", _reason_text(reason))
             logging.info("매매 결정: hold")
 
     except Exception as e:
@@ -273,49 +521,343 @@ def execute_trade(decision, reason, symbol="BTCUSDT"):
 #######################
 # 예: Vision API 로직 #
 #######################
-def get_ai_decision_with_chart(optimized_data):
+async def stream_ai_answer(messages, model=MODEL, max_tokens=150):
+    """
+    Chat Completions 응답을 스트리밍으로 받아, 생성되는 텍스트 조각을 순서대로 반환하는 비동기 제너레이터.
+    공유 AsyncOpenAI 클라이언트(연결 풀 재사용)를 쓰므로 이벤트 루프 스레드를 막지 않는다.
+    요청은 rate limiter를 거치며, 응답 헤더의 남은 한도를 반영하고 429를 받으면 retry-after만큼 쉬었다가 다시 요청한다.
+    """
+    client = _get_async_openai_client()
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        async with _openai_limiter:
+            try:
+                raw = await client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    **DECISION_TOOL_ARGS
+                )
+            except openai.RateLimitError as e:
+                _openai_limiter.backoff(float(e.response.headers.get("retry-after") or 1))
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                continue
+            _openai_limiter.update_from_headers(raw.headers)
+
+            async for chunk in raw.parse():
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    # 함수 호출이 강제되므로 응답은 trade 함수 인자(JSON) 조각으로 온다
+                    if delta.tool_calls:
+                        yield delta.tool_calls[0].function.arguments or ""
+                    else:
+                        yield delta.content or ""
+            return
+
+def _system_prompt():
+    """
+    시스템 프롬프트를 반환하는 함수.
+    매번 파일을 여는 대신 stat으로 수정 시각만 확인해, 바뀌었을 때만 다시 읽는다 (재시작 없이 프롬프트 수정 반영).
     """
-    Vision 모델을 사용해 AI에게 매매 결정을 요청하는 함수 예시.
-    (별도 구현 필요 시)
+    try:
+        mtime = os.stat(PROMPT_PATH).st_mtime
+        if mtime != _prompt_cache["mtime"]:
+            with open(PROMPT_PATH, encoding="utf-8") as prompt_file:
+                _prompt_cache["text"] = prompt_file.read().strip() or DEFAULT_SYSTEM_PROMPT
+            _prompt_cache["message"] = {"role": "system", "content": _prompt_cache["text"]}
+            _prompt_cache["mtime"] = mtime
+            logging.info(f"시스템 프롬프트 로드: {PROMPT_PATH}")
+    except OSError as e:
+        if _prompt_cache["mtime"] is not None:
+            logging.warning(f"시스템 프롬프트 파일을 읽지 못해 마지막 값을 사용합니다: {e}")
+            _prompt_cache["mtime"] = None
+    return _prompt_cache["text"]
+
+def _system_message():
+    """
+    system 메시지 dict를 반환하는 함수.
+    프롬프트가 바뀌지 않는 한 같은 dict 객체를 돌려주므로 호출하는 쪽에서 수정하면 안 된다.
     """
-    # 예) OPENAI_API_KEY 준비
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    openai.api_key = openai_api_key
+    _system_prompt()
+    return _prompt_cache["message"]
 
-    # 예시 prompt / 메시지 구성
-    system_prompt = (
-        "You are a crypto trading assistant with vision. "
-        "Analyze the user-provided chart image and other data, then decide: long/short/buy/sell/hold."
-    )
-    text_content = json.dumps(optimized_data, ensure_ascii=False, indent=2)
+# import 시점에 미리 읽어 두어, 첫 매매 결정부터는 stat 한 번만 발생
+_system_prompt()
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Here is the crypto data:\n{text_content}\n Please output a JSON with 'decision' and 'reason'."}
+def build_ai_messages(optimized_data):
+    """
+    최적화된 데이터로 Vision 모델에 보낼 messages 리스트를 구성하는 함수.
+    """
+    text_content, chart_image = _serialize_payload(optimized_data)
+
+    user_content = [
+        {"type": "text", "text": f"Here is the crypto data:\n{text_content}\n Please call the trade function with 'decision' and 'reason'."}
     ]
+    if chart_image:
+        user_content.append({"type": "image_url", "image_url": {"url": chart_image}})
 
-    # (필요 시 chart_image base64 -> data:image/png;base64,... 형식 Vision에 전달)
-    # ...
+    return [
+        _system_message(),
+        {"role": "user", "content": user_content}
+    ]
 
+def _serialize_payload(optimized_data):
+    """
+    최적화된 데이터를 (텍스트 JSON, 차트 이미지 data URL)로 나누는 함수.
+    """
+    # 차트 이미지(data URL)는 텍스트 JSON에 넣지 않고 Vision 이미지 파트로 따로 전달
+    chart_image = optimized_data.get("chart_image")
+    text_data = {k: v for k, v in optimized_data.items() if k != "chart_image"}
+
+    # orjson은 numpy 값/datetime도 바로 직렬화하며 항상 UTF-8로 출력 (ensure_ascii=False와 동일)
+    # OPT_NON_STR_KEYS: 숫자/타임스탬프 키가 섞여도 str 변환 없이 그대로 직렬화
+    # OPT_SORT_KEYS: 키 순서를 고정해 데이터가 같으면 바이트도 같게 만든다
+    text_content = orjson.dumps(
+        text_data,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+    ).decode()
+    return text_content, chart_image
+
+def parse_ai_answer(ai_answer):
+    """
+    AI 응답 문자열에서 (decision, reason)을 추출하는 함수.
+    """
+    # JSON 파싱 ("Sure! {...}"처럼 앞뒤에 문장이 붙어 있으면 JSON 객체 부분만 파싱)
+    match = _JSON_RE.search(ai_answer)
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=messages,
-            max_tokens=500
-        )
-        ai_answer = response.choices[0].message.content.strip()
+        ai_result = orjson.loads(match.group(0) if match else ai_answer)
+        decision = ai_result.get("decision", "hold").lower()
+        reason = ai_result.get("reason", "No reason provided.")
+    except (orjson.JSONDecodeError, AttributeError):
+        # JSON이 아니거나 객체가 아닌 응답은 hold로 처리 (KeyboardInterrupt 등은 그대로 전파)
+        decision = "hold"
+        reason = ai_answer
+
+    return (decision, reason)
+
+def _quantize(value, field=None):
+    """
+    결정 캐시 키용으로 float를 줄이는 함수 (중첩 dict/list까지 재귀 처리).
+    가격/지표 필드는 DECISION_CACHE_ROUNDING의 자릿수로 반올림하고, 그 밖의 float는 유효숫자 5자리로 줄인다.
+    가격이 조금 움직인 정도의 거의 같은 데이터는 같은 키가 된다.
+    """
+    if isinstance(value, float):
+        if field in DECISION_CACHE_ROUNDING:
+            return round(value, DECISION_CACHE_ROUNDING[field])
+        return float(f"{value:.5g}")
+    if isinstance(value, dict):
+        return {k: _quantize(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_quantize(v, field) for v in value]
+    return value
+
+def _decision_cache_key(optimized_data):
+    """
+    최적화된 데이터로 결정 캐시 키(SHA-256)를 만드는 함수.
+    차트 이미지는 같은 캔들 데이터로 그려지므로 키에서 제외한다.
+    """
+    data = {k: v for k, v in optimized_data.items() if k != "chart_image"}
+    payload = orjson.dumps(_quantize(data), option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+def _decision_cache_get(key):
+    """
+    DECISION_CACHE_TTL 초 이내에 같은 키로 받은 결정이 있으면 (decision, reason)을, 없으면 None을 반환하는 함수.
+    """
+    with _decision_cache_lock:
+        cached = _decision_cache.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[2] >= DECISION_CACHE_TTL:
+            del _decision_cache[key]
+            return None
+        _decision_cache.move_to_end(key)
+    logging.info("동일한 데이터에 대한 AI 결정 캐시 사용.")
+    return cached[0], cached[1]
+
+def _decision_cache_put(key, decision):
+    """
+    AI 결정을 캐시에 저장하는 함수. DECISION_CACHE_SIZE를 넘으면 가장 오래 쓰지 않은 항목부터 제거한다.
+    """
+    with _decision_cache_lock:
+        _decision_cache[key] = (decision[0], decision[1], time.monotonic())
+        _decision_cache.move_to_end(key)
+        while len(_decision_cache) > DECISION_CACHE_SIZE:
+            _decision_cache.popitem(last=False)
+
+async def get_ai_decision_with_chart(optimized_data, on_decision=None):
+    """
+    Vision 모델을 사용해 AI에게 매매 결정을 요청하는 코루틴.
+    on_decision을 넘기면 스트림에서 decision 값이 보이는 즉시 on_decision(decision)을 호출한다
+    (trade 함수 스키마상 decision이 reason보다 먼저 생성됨).
+    """
+    cache_key = _decision_cache_key(optimized_data)
+    cached = _decision_cache_get(cache_key)
+    if cached is not None:
+        # 캐시된 결정은 이미 한 번 전달된 것이므로 on_decision을 다시 호출하지 않는다
+        return cached
+
+    messages = build_ai_messages(optimized_data)
+
+    try:
+        chunks = []
+        early_decision = None
+        async for piece in stream_ai_answer(messages, model=MODEL, max_tokens=150):
+            chunks.append(piece)
+            if on_decision is not None and early_decision is None:
+                match = _DECISION_RE.search("".join(chunks))
+                if match:
+                    early_decision = match.group(1).lower()
+                    on_decision(early_decision)
+        ai_answer = "".join(chunks).strip()
         logging.info(f"[AI Raw Answer]: {ai_answer}")
     except Exception as e:
         logging.error(f"OpenAI API 요청 중 오류: {e}")
         return ("hold", "OpenAI API 오류")
 
-    # JSON 파싱
+    decision = parse_ai_answer(ai_answer)
+    _decision_cache_put(cache_key, decision)
+    return decision
+
+async def execute_trade_streaming(optimized_data, symbol="BTCUSDT"):
+    """
+    AI 결정을 스트리밍으로 받으면서, decision 값이 나오는 즉시 워커 스레드에서 매매를 시작하는 코루틴.
+    주문은 reason 생성이 끝나기를 기다리지 않고, reason은 응답이 끝나면 주문 스레드에 전달되어 기록된다.
+    반환값은 실제로 실행한 (decision, reason).
+    직전과 거의 같은 데이터로 캐시된 결정이 있으면 이미 실행한 결정이므로, 주문을 다시 내지 않고 그대로 반환한다
+    (캐시 키에 포지션 상태가 없어 같은 long/short가 중복 진입되는 것을 막기 위함).
+    """
+    cached = _decision_cache_get(_decision_cache_key(optimized_data))
+    if cached is not None:
+        logging.info(f"캐시된 결정 재사용, 주문은 다시 실행하지 않음: {cached[0]}")
+        return cached
+
+    reason_future = Future()
+    trade_tasks = []
+    executed = []
+
+    def _start_trade(decision):
+        executed.append(decision)
+        trade_tasks.append(asyncio.create_task(
+            asyncio.to_thread(execute_trade, decision, reason_future, symbol=symbol)
+        ))
+
+    decision, reason = "hold", "AI 결정 요청 중 오류"
     try:
-        ai_result = json.loads(ai_answer)
-        decision = ai_result.get("decision", "hold").lower()
-        reason = ai_result.get("reason", "No reason provided.")
-    except:
-        decision = "hold"
-        reason = ai_answer
+        decision, reason = await get_ai_decision_with_chart(optimized_data, on_decision=_start_trade)
+    finally:
+        # 주문 스레드가 reason을 기다리다 멈추지 않도록 항상 채워 준다
+        reason_future.set_result(reason)
+
+    if not executed:
+        # 스트림에서 decision을 찾지 못한 경우 (API 오류 등): 최종 결과로 실행
+        await asyncio.to_thread(execute_trade, decision, reason, symbol=symbol)
+        return decision, reason
+
+    if decision != executed[0]:
+        # decision을 받은 뒤 스트림이 끊긴 경우 등: 이미 주문이 나간 결정을 반환
+        logging.warning(f"스트림 최종 결과({decision})가 먼저 실행한 결정({executed[0]})과 다릅니다: {reason}")
+        decision = executed[0]
+    await asyncio.gather(*trade_tasks)
+    return decision, reason
+
+###################
+# Batch API 로직 #
+###################
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def submit_batch(prompts, model=MODEL, max_tokens=150):
+    """
+    여러 요청을 OpenAI Batch API로 제출하고 batch_id를 반환하는 함수.
+    prompts는 {"custom_id": str, "messages": list} 딕셔너리의 리스트.
+    결과는 24시간 안에 반환되며 요금은 일반 요청의 절반이다.
+    """
+    lines = [
+        orjson.dumps({
+            "custom_id": prompt["custom_id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model, "messages": prompt["messages"], "max_tokens": max_tokens,
+                     **DECISION_TOOL_ARGS},
+        })
+        for prompt in prompts
+    ]
+    client = _get_openai_client()
+    batch_file = client.files.create(file=("batch.jsonl", b"\n".join(lines)), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logging.info(f"Batch 제출 완료: {batch.id} ({len(prompts)}건)")
+    return batch.id
 
-    return (decision, reason)
+def poll_batch(batch_id, initial_delay=5, max_delay=300, deadline=None):
+    """
+    Batch가 끝날 때까지 지수 백오프로 상태를 조회하고, {custom_id: (decision, reason)}를 반환하는 함수.
+    deadline(time.time() 기준 시각, 기본: 24시간 뒤)까지 끝나지 않으면 Batch를 취소하고 빈 딕셔너리를 반환한다.
+    실패/만료/취소된 경우에도 빈 딕셔너리를 반환한다.
+    """
+    client = _get_openai_client()
+    delay = initial_delay
+    if deadline is None:
+        deadline = time.time() + 24 * 60 * 60
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in BATCH_FINAL_STATUSES:
+            break
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            logging.error(f"Batch 대기 시간 초과, 취소합니다: {batch_id} (상태: {batch.status})")
+            try:
+                client.batches.cancel(batch_id)
+            except Exception as e:
+                logging.warning(f"Batch 취소 중 오류: {batch_id} ({e})")
+            return {}
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        logging.error(f"Batch 처리 실패: {batch_id} (상태: {batch.status})")
+        return {}
+
+    results = {}
+    for line in client.files.content(batch.output_file_id).content.splitlines():
+        if not line:
+            continue
+        item = orjson.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            logging.error(f"Batch 요청 오류 ({item.get('custom_id')}): {item.get('error')}")
+            results[item["custom_id"]] = ("hold", "OpenAI API 오류")
+            continue
+        message = response["body"]["choices"][0]["message"]
+        tool_calls = message.get("tool_calls")
+        ai_answer = (tool_calls[0]["function"]["arguments"] if tool_calls else message.get("content") or "").strip()
+        logging.info(f"[AI Raw Answer] {item['custom_id']}: {ai_answer}")
+        results[item["custom_id"]] = parse_ai_answer(ai_answer)
+    return results
+
+def evaluate_batched(optimized_data_by_symbol, model=MODEL, max_tokens=150, deadline=None):
+    """
+    심볼별 최적화 데이터를 Batch API로 한 번에 평가해 [(custom_id, decision, reason), ...]를 반환하는 함수.
+    결과가 최대 24시간 뒤에 나오므로 백테스트/야간 재평가 등 실시간성이 필요 없는 작업에만 사용하며,
+    오래된 결정일 수 있으므로 주문은 실행하지 않는다.
+
+    Parameters:
+        optimized_data_by_symbol (dict): {symbol: optimized_data}
+        deadline (float): 결과를 기다릴 마지막 시각 (time.time() 기준). 넘기면 Batch를 취소한다.
+    """
+    prompts = [
+        {"custom_id": symbol, "messages": build_ai_messages(data)}
+        for symbol, data in optimized_data_by_symbol.items()
+    ]
+    try:
+        batch_id = submit_batch(prompts, model=model, max_tokens=max_tokens)
+        results = poll_batch(batch_id, deadline=deadline)
+    except Exception as e:
+        logging.error(f"Batch API 요청 중 오류: {e}")
+        return []
+
+    return [(custom_id, decision, reason) for custom_id, (decision, reason) in results.items()]
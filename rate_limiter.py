@@ -0,0 +1,150 @@
+# rate_limiter.py
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+# "1m30s", "6.5s", "120ms" 형태의 OpenAI reset 헤더 파싱용
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """
+    OpenAI rate limit 헤더의 기간 문자열(예: "1m30s", "120ms")을 초 단위 float로 변환하는 함수.
+    """
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in _DURATION_RE.findall(value or ""))
+
+
+class HeaderAwareRateLimiter:
+    """
+    동시 요청 수와 분당 요청 수를 제한하는 비동기 rate limiter.
+    응답 헤더(x-ratelimit-remaining-requests / x-ratelimit-reset-requests)로 서버가 알려주는
+    남은 한도를 반영하고, 429 응답의 retry-after 동안은 새 요청을 보내지 않는다.
+
+    사용 예:
+        async with limiter:
+            response = await ...
+        limiter.update_from_headers(response.headers)
+    """
+
+    def __init__(self, max_concurrent=8, requests_per_minute=500):
+        self.requests_per_minute = requests_per_minute
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._lock = asyncio.Lock()
+        self._sent = deque()  # 최근 60초 동안 보낸 요청 시각
+        self._remaining = None  # 서버가 알려준 남은 요청 수 (헤더를 받기 전에는 None)
+        self._reset_at = 0.0  # 남은 요청 수가 다시 채워지는 시각 (monotonic)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            await self._wait_for_slot()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._semaphore.release()
+
+    async def _wait_for_slot(self):
+        """
+        분당 요청 수와 서버가 알려준 남은 한도 안에서 요청을 보낼 수 있을 때까지 대기하는 내부 헬퍼 메서드.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= 60:
+                    self._sent.popleft()
+
+                if self._remaining is not None and self._remaining <= 0 and now < self._reset_at:
+                    delay = self._reset_at - now
+                elif len(self._sent) >= self.requests_per_minute:
+                    delay = 60 - (now - self._sent[0])
+                else:
+                    self._sent.append(now)
+                    if self._remaining is not None:
+                        self._remaining -= 1
+                    return
+
+                logging.info(f"rate limit 대기: {delay:.2f}초")
+                await asyncio.sleep(delay)
+
+    def update_from_headers(self, headers):
+        """
+        응답 헤더의 남은 요청 수와 reset 시간을 반영하는 메서드.
+        """
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        if remaining is None:
+            return
+        try:
+            self._remaining = int(remaining)
+        except ValueError:
+            return
+        self._reset_at = time.monotonic() + parse_duration(headers.get("x-ratelimit-reset-requests"))
+
+    def backoff(self, retry_after):
+        """
+        429 응답을 받았을 때 retry_after 초 동안 새 요청을 막는 메서드.
+        """
+        self._remaining = 0
+        self._reset_at = max(self._reset_at, time.monotonic() + retry_after)
+        logging.warning(f"rate limit 초과 (429): {retry_after:.1f}초 동안 요청 중단")
+
+
+class BinanceWeightGuard:
+    """
+    바이낸스 응답 헤더의 1분 사용 가중치(X-MBX-USED-WEIGHT-1M)를 추적하는 스레드 안전 클래스.
+    사용량이 한도의 threshold 비율에 도달하면 다음 분이 시작될 때까지 paused_for()가 남은 시간을 반환한다.
+    직접 대기(sleep)하지 않으므로, 캐시된 값을 쓸지 요청을 생략할지는 호출하는 쪽에서 정한다.
+
+    사용 예:
+        session.hooks["response"].append(guard.response_hook)
+        if guard.paused_for():
+            ...  # 요청 생략
+    """
+
+    def __init__(self, weight_limit, threshold=0.9):
+        self.weight_limit = weight_limit
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._paused_until = 0.0  # 요청을 다시 보내도 되는 시각 (time.time 기준, 분 경계)
+
+    def update_from_headers(self, headers):
+        """
+        응답 헤더의 사용 가중치를 반영하는 메서드. 한도에 가까우면 다음 분까지 요청을 멈추도록 표시한다.
+        """
+        used_weight = headers.get("X-MBX-USED-WEIGHT-1M")
+        if used_weight is None:
+            return
+        try:
+            used_weight = int(used_weight)
+        except ValueError:
+            return
+        if used_weight < self.weight_limit * self.threshold:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._paused_until = max(self._paused_until, now - now % 60 + 60)
+        logging.warning(f"바이낸스 요청 가중치 {used_weight}/{self.weight_limit}, 다음 분까지 요청 중단.")
+
+    def response_hook(self, response, *args, **kwargs):
+        """
+        requests 세션의 response 훅으로 등록해 모든 응답의 사용 가중치를 반영하는 메서드.
+        """
+        self.update_from_headers(response.headers)
+
+    def paused_for(self):
+        """
+        요청을 멈춰야 하는 남은 시간(초)을 반환하는 메서드. 멈출 필요가 없으면 0.
+        """
+        with self._lock:
+            return max(0.0, self._paused_until - time.time())
+
+
+# 현물 API(api.binance.com)의 IP당 1분 가중치 한도는 data_fetcher와 openai_trader가 함께 쓰므로 하나의 guard를 공유
+binance_weight = BinanceWeightGuard(weight_limit=6000)